@@ -0,0 +1,280 @@
+"""In-memory stand-in for Sublime's ``sublime`` module, as far as the JEP plugin uses it.
+
+Timeouts are queued and run by ``run_timers``, which stands in for Sublime's UI thread. ``timer_hook`` is called with each
+callback and the seconds it took, to measure how long the plugin blocks the UI.
+"""
+import heapq
+import itertools
+import os
+import tempfile
+import time
+
+INHIBIT_WORD_COMPLETIONS = 8
+INHIBIT_EXPLICIT_COMPLETIONS = 16
+DRAW_NO_FILL = 32
+DRAW_NO_OUTLINE = 64
+DRAW_SQUIGGLY_UNDERLINE = 256
+
+#: Base directory of packages and cache directory, set by the harness.
+DATA_PATH = os.path.join(tempfile.gettempdir(), 'jep-bench')
+#: Called with callback and duration in seconds after each timeout callback, if set.
+timer_hook = None
+
+_timers = []
+_sequence = itertools.count()
+_ids = itertools.count(1)
+_windows = []
+_settings = {}
+
+
+def set_timeout(callback, delay=0):
+    heapq.heappush(_timers, (time.monotonic() + delay / 1000, next(_sequence), callback))
+
+
+def set_timeout_async(callback, delay=0):
+    set_timeout(callback, delay)
+
+
+def run_timers(seconds=0.0):
+    """Runs due timeout callbacks for given seconds, like Sublime's UI thread would."""
+    end = time.monotonic() + seconds
+    while True:
+        now = time.monotonic()
+        if _timers and _timers[0][0] <= now:
+            _, _, callback = heapq.heappop(_timers)
+            started = time.perf_counter()
+            callback()
+            if timer_hook:
+                timer_hook(callback, time.perf_counter() - started)
+            continue
+        if now >= end:
+            return
+        time.sleep(min(0.002, end - now, max(0.0, _timers[0][0] - now) if _timers else 0.002))
+
+
+def reset():
+    """Forgets all windows, settings and timeouts."""
+    del _timers[:]
+    del _windows[:]
+    _settings.clear()
+
+
+def packages_path():
+    return os.path.join(DATA_PATH, 'Packages')
+
+
+def cache_path():
+    return os.path.join(DATA_PATH, 'Cache')
+
+
+def load_settings(name):
+    return _settings.setdefault(name, Settings())
+
+
+def save_settings(name):
+    pass
+
+
+def status_message(message):
+    pass
+
+
+def windows():
+    return list(_windows)
+
+
+def active_window():
+    return _windows[0] if _windows else None
+
+
+class Settings(dict):
+    def get(self, key, default=None):
+        return dict.get(self, key, default)
+
+    def set(self, key, value):
+        self[key] = value
+
+    def add_on_change(self, key, callback):
+        pass
+
+
+class Region:
+    def __init__(self, a, b=None):
+        self.a = a
+        self.b = a if b is None else b
+
+    def begin(self):
+        return min(self.a, self.b)
+
+    def end(self):
+        return max(self.a, self.b)
+
+    def empty(self):
+        return self.a == self.b
+
+    def __repr__(self):
+        return 'Region(%d, %d)' % (self.a, self.b)
+
+
+class Window:
+    """Window with a single group of views, the last opened or focused one being active."""
+
+    def __init__(self, folders=()):
+        self._id = next(_ids)
+        self._views = []
+        self._folders = list(folders)
+        self._active = None
+        _windows.append(self)
+
+    def id(self):
+        return self._id
+
+    def views(self):
+        return list(self._views)
+
+    def folders(self):
+        return list(self._folders)
+
+    def num_groups(self):
+        return 1
+
+    def active_group(self):
+        return 0
+
+    def active_view(self):
+        return self._active
+
+    def active_view_in_group(self, group):
+        return self._active
+
+    def get_view_index(self, view):
+        return (0, self._views.index(view)) if view in self._views else (-1, -1)
+
+    def open_file(self, filename, content=''):
+        """Opens view of given file, showing given content instead of reading the file."""
+        view = View(self, filename, content)
+        self._views.append(view)
+        self._active = view
+        return view
+
+    def new_file(self):
+        view = View(self, None, '')
+        self._views.append(view)
+        self._active = view
+        return view
+
+    def focus_view(self, view):
+        self._active = view
+
+
+class View:
+    def __init__(self, window, filename, content):
+        self._id = next(_ids)
+        self._window = window
+        self._filename = filename
+        self._content = content
+        self._selection = [Region(len(content))]
+        self._change_count = 0
+        self._valid = True
+        self.statuses = {}
+        self.regions = {}
+
+    def id(self):
+        return self._id
+
+    def buffer_id(self):
+        return self._id
+
+    def window(self):
+        return self._window if self._valid else None
+
+    def file_name(self):
+        return self._filename
+
+    def set_file_name(self, filename):
+        """Not part of Sublime's API, renames the file shown like "save as" does."""
+        self._filename = filename
+
+    def is_valid(self):
+        return self._valid
+
+    def is_loading(self):
+        return False
+
+    def size(self):
+        return len(self._content)
+
+    def substr(self, x):
+        if isinstance(x, int):
+            return self._content[x:x + 1]
+        return self._content[x.begin():x.end()]
+
+    def change_count(self):
+        return self._change_count
+
+    def sel(self):
+        return self._selection
+
+    def rowcol(self, point):
+        before = self._content[:point]
+        return before.count('\n'), len(before) - before.rfind('\n') - 1
+
+    def text_point(self, row, col):
+        lines = self._content.split('\n')
+        return sum(len(line) + 1 for line in lines[:row]) + col
+
+    def line(self, x):
+        point = x.a if isinstance(x, Region) else x
+        start = self._content.rfind('\n', 0, point) + 1
+        end = self._content.find('\n', point)
+        return Region(start, len(self._content) if end < 0 else end)
+
+    def set_status(self, key, value):
+        self.statuses[key] = value
+
+    def get_status(self, key):
+        return self.statuses.get(key, '')
+
+    def erase_status(self, key):
+        self.statuses.pop(key, None)
+
+    def add_regions(self, key, regions, scope='', icon='', flags=0):
+        self.regions[key] = list(regions)
+
+    def get_regions(self, key):
+        return self.regions.get(key, [])
+
+    def erase_regions(self, key):
+        self.regions.pop(key, None)
+
+    def insert_at_caret(self, text):
+        """Types text at the caret, like the user would."""
+        point = self._selection[0].b
+        self._content = self._content[:point] + text + self._content[point:]
+        self._selection = [Region(point + len(text))]
+        self._change_count += 1
+
+    def set_name(self, name):
+        self.name = name
+
+    def set_scratch(self, scratch):
+        pass
+
+    def run_command(self, command, args=None):
+        if command == 'append':
+            self.replace_range(len(self._content), len(self._content), args['characters'])
+
+    def replace_range(self, start, end, text):
+        """Replaces content between ``start`` and ``end`` by text, placing the caret behind it."""
+        self._content = self._content[:start] + text + self._content[end:]
+        self._selection = [Region(start + len(text))]
+        self._change_count += 1
+
+    def set_caret(self, point):
+        self._selection = [Region(point)]
+
+    def close(self):
+        self._valid = False
+        self._window._views.remove(self)
+        if self._window._active is self:
+            self._window._active = self._window._views[-1] if self._window._views else None
@@ -0,0 +1,19 @@
+"""In-memory stand-in for Sublime's ``sublime_plugin`` module."""
+
+
+class EventListener:
+    pass
+
+
+class ApplicationCommand:
+    pass
+
+
+class WindowCommand:
+    def __init__(self, window):
+        self.window = window
+
+
+class TextCommand:
+    def __init__(self, view):
+        self.view = view
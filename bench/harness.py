@@ -0,0 +1,210 @@
+"""Headless harness running the JEP plugin against stub backends, with Sublime replaced by in-memory fakes.
+
+The plugin is imported as package ``JEP`` from the repository root, the fake ``sublime`` and ``sublime_plugin`` modules are
+taken from ``bench/fake``. ``jep_py`` must be importable by the running interpreter, its location is passed on to the stub
+backend processes.
+"""
+import collections
+import collections.abc
+import importlib
+import os
+import re
+import shutil
+import sys
+import tempfile
+import time
+import types
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+REPO_DIR = os.path.dirname(BENCH_DIR)
+PACKAGE_NAME = 'JEP'
+
+if not hasattr(collections, 'Hashable'):
+    # contrib/umsgpack predates the removal of the ABC aliases from collections:
+    collections.Hashable = collections.abc.Hashable
+
+sys.path.insert(0, os.path.join(BENCH_DIR, 'fake'))
+sys.path.append(os.path.join(REPO_DIR, 'contrib'))
+import sublime  # noqa: E402 (fake module)
+
+
+def load_plugin():
+    """Imports and returns the plugin module, as Sublime would."""
+    if PACKAGE_NAME not in sys.modules:
+        package = types.ModuleType(PACKAGE_NAME)
+        package.__path__ = [REPO_DIR]
+        sys.modules[PACKAGE_NAME] = package
+    return importlib.import_module(PACKAGE_NAME + '.plugin')
+
+
+def load_plugin_module(name):
+    """Imports and returns given module of the plugin package, e.g. ``jep_sublime.recording``."""
+    load_plugin()
+    return importlib.import_module(PACKAGE_NAME + '.' + name)
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+class LatencyRecorder:
+    """Durations of named operations."""
+
+    def __init__(self):
+        self.samples = collections.OrderedDict()
+
+    def record(self, name, seconds):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def rows(self):
+        """Returns ``(name, count, mean, p50, p95, max)`` per operation, durations in milliseconds."""
+        for name, values in self.samples.items():
+            values = sorted(values)
+            yield (name, len(values), 1000 * sum(values) / len(values), 1000 * percentile(values, 0.5), 1000 * percentile(values, 0.95),
+                   1000 * values[-1])
+
+    def format_table(self):
+        lines = ['%-28s %7s %9s %9s %9s %9s' % ('operation', 'count', 'mean ms', 'p50 ms', 'p95 ms', 'max ms')]
+        for row in self.rows():
+            lines.append('%-28s %7d %9.3f %9.3f %9.3f %9.3f' % row)
+        return '\n'.join(lines)
+
+
+class Harness:
+    """Drives the plugin's event listener like Sublime would and records the latency of each callback.
+
+    Files are created in a temporary project with one ``.jep`` directory per backend, file ``name`` of backend ``i`` is
+    handled by the ``i``-th stub backend. Timeout callbacks (connection polling, content synchronization) are timed by
+    the name of the function scheduled.
+    """
+
+    def __init__(self, backends=1, options=20, delay_ms=0, settings=None):
+        self.workdir = tempfile.mkdtemp(prefix='jep-bench-')
+        sublime.reset()
+        sublime.DATA_PATH = self.workdir
+        sublime.timer_hook = self._on_timer
+        os.environ['PYTHONPATH'] = self._jep_py_path()
+
+        self.latency = LatencyRecorder()
+        #: Total seconds spent in callbacks, i.e. the time the UI thread was blocked by the plugin.
+        self.busy_seconds = 0.0
+        self.project_dirs = []
+        for index in range(backends):
+            project_dir = os.path.join(self.workdir, 'backend%d' % index)
+            os.makedirs(project_dir)
+            with open(os.path.join(project_dir, '.jep'), 'w') as f:
+                f.write('*.stub:\n"%s" "%s" --options %d --delay-ms %d\n' % (sys.executable, os.path.join(BENCH_DIR, 'stub_backend.py'), options,
+                                                                           delay_ms))
+            self.project_dirs.append(project_dir)
+
+        self.plugin = load_plugin()
+        plugin_settings = sublime.load_settings('JEP.sublime-settings')
+        plugin_settings.update(settings or {})
+        self.plugin.JepSublimeEventListener.instance = None
+        self.listener = self.plugin.JepSublimeEventListener()
+        self.window = sublime.Window(self.project_dirs)
+        self._timed('plugin_loaded', self.plugin.plugin_loaded)
+
+    @staticmethod
+    def _jep_py_path():
+        import jep_py
+        return os.path.dirname(os.path.dirname(os.path.abspath(jep_py.__file__)))
+
+    @property
+    def manager(self):
+        return self.listener.backend_adapter
+
+    def _timed(self, name, function, *args):
+        started = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - started
+        self.latency.record(name, seconds)
+        self.busy_seconds += seconds
+        return result
+
+    def _on_timer(self, callback, seconds):
+        self.busy_seconds += seconds
+        self.latency.record('timer ' + getattr(callback, '__name__', type(callback).__name__), seconds)
+
+    def open(self, name, content='', backend=0):
+        """Opens file of given name handled by given backend and returns its view."""
+        view = self.add_view(name, content, backend)
+        self.load(view)
+        self._timed('on_activated', self.listener.on_activated, view)
+        return view
+
+    def add_view(self, name, content='', backend=0):
+        """Adds view of given file without notifying the plugin."""
+        return self.window.open_file(os.path.join(self.project_dirs[backend], name), content)
+
+    def load(self, view):
+        self._timed('on_load', self.listener.on_load, view)
+
+    def save(self, view):
+        self._timed('on_post_save', self.listener.on_post_save, view)
+
+    def save_as(self, view, name, backend=0):
+        """Saves view under given file name handled by given backend, like "save as"."""
+        view.set_file_name(os.path.join(self.project_dirs[backend], name))
+        self.save(view)
+
+    def activate(self, view):
+        self.window.focus_view(view)
+        self._timed('on_activated', self.listener.on_activated, view)
+
+    def type(self, view, text):
+        """Types text character by character into view."""
+        for char in text:
+            view.insert_at_caret(char)
+            self._timed('on_modified', self.listener.on_modified, view)
+            self._timed('on_selection_modified', self.listener.on_selection_modified, view)
+
+    def modify(self, view, start, end, text):
+        """Replaces content of view between ``start`` and ``end`` by text in a single modification."""
+        view.replace_range(start, end, text)
+        self._timed('on_modified', self.listener.on_modified, view)
+
+    def select(self, view, point):
+        view.set_caret(point)
+        self._timed('on_selection_modified', self.listener.on_selection_modified, view)
+
+    def complete(self, view, prefix=None, pos=None):
+        """Queries completions at given position (default: caret) and returns them."""
+        pos = view.sel()[0].b if pos is None else pos
+        if prefix is None:
+            # like Sublime, complete the word in front of the position:
+            prefix = re.search(r'\w*$', view.substr(sublime.Region(view.line(pos).begin(), pos))).group()
+        return self._timed('on_query_completions', self.listener.on_query_completions, view, prefix, [pos])[0]
+
+    def close(self, view):
+        view.close()
+        self._timed('on_close', self.listener.on_close, view)
+
+    def run(self, seconds):
+        """Lets time pass, running timeout callbacks."""
+        sublime.run_timers(seconds)
+
+    def wait_until(self, predicate, timeout=10.0):
+        """Runs timeout callbacks until predicate holds and returns the seconds waited, ``None`` on timeout."""
+        started = time.perf_counter()
+        while time.perf_counter() - started < timeout:
+            if predicate():
+                return time.perf_counter() - started
+            sublime.run_timers(0.005)
+        return None
+
+    def wait_connected(self, timeout=10.0):
+        from jep_py.frontend import State
+        return self.wait_until(lambda: self.manager and self.manager.registry.connections() and all(
+            con.state is State.Connected for con in self.manager.registry.connections()), timeout)
+
+    def shutdown(self):
+        """Shuts down all backends and removes the temporary project."""
+        manager = self.manager
+        if manager:
+            for con in manager.registry.connections():
+                manager.retire_connection(con)
+            self.wait_until(lambda: not manager._retiring, 5.0)
+        self.plugin.plugin_unloaded()
+        sublime.timer_hook = None
+        shutil.rmtree(self.workdir, ignore_errors=True)
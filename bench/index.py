@@ -0,0 +1,63 @@
+"""Checks that completion index queries stay within their time budget while typing, on a large completion response.
+
+    python bench/index.py --options 50000 --budget-ms 1
+
+Types each word character by character against an index of synthetic options and measures every query. Each typing
+session is repeated on a fresh index and the fastest time per query is kept, to leave out scheduling noise. The index of
+the last session is dropped before the next one is built, otherwise the queries mostly measure page faults on memory it
+returned to the system. Exits with status 1 if any query took longer than the budget.
+"""
+import argparse
+import random
+import string
+import sys
+import time
+from harness import load_plugin_module, percentile
+
+WORDS = ('getValue', 'zzzzz', 'a_b_c', 'set_item', 'xyzzy', 'parse_options', 'q1w2', 'Abc', 'zqxj', 'ToString', 'e')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--options', type=int, default=50000, help='completion options in the response')
+    parser.add_argument('--limit', type=int, default=200, help='options returned per query, like max_completion_results')
+    parser.add_argument('--rounds', type=int, default=3, help='typing sessions per word, each on a fresh index')
+    parser.add_argument('--budget-ms', type=float, default=1.0, help='maximal duration of a query')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    CompletionIndex = load_plugin_module('jep_sublime.index').CompletionIndex
+    rng = random.Random(args.seed)
+    chars = string.ascii_letters + string.digits + '_'
+    options = [(''.join(rng.choice(chars) for _ in range(rng.randint(3, 20))), 'desc') for _ in range(args.options)]
+
+    started = time.perf_counter()
+    CompletionIndex(options).warm()
+    print('index of %d options built and warmed in %.1f ms' % (args.options, 1000 * (time.perf_counter() - started)))
+
+    fastest = {}
+    for _ in range(args.rounds):
+        index = None
+        index = CompletionIndex(options)
+        index.warm()
+        for word in WORDS:
+            for length in range(1, len(word) + 1):
+                prefix = word[:length]
+                started = time.perf_counter()
+                index.query(prefix, args.limit)
+                duration = 1000 * (time.perf_counter() - started)
+                fastest[prefix] = min(duration, fastest.get(prefix, duration))
+
+    durations = sorted(fastest.values())
+    slowest = max(fastest, key=fastest.get)
+    print('%d queries: p50 %.3f ms, p95 %.3f ms, max %.3f ms (%r)' % (len(durations), percentile(durations, 0.5), percentile(durations, 0.95),
+                                                                   durations[-1], slowest))
+    over = sorted(prefix for prefix, duration in fastest.items() if duration > args.budget_ms)
+    if over:
+        print('over budget of %.1f ms: %s' % (args.budget_ms, ', '.join('%r (%.3f ms)' % (prefix, fastest[prefix]) for prefix in over)))
+        sys.exit(1)
+    print('all queries within budget of %.1f ms' % args.budget_ms)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,67 @@
+"""Runs the plugin pipeline once through load, edit, sync, complete, problems, save as and close, and prints callback latencies.
+
+    python bench/pipeline.py --files 5 --chars 200
+"""
+import argparse
+import time
+from harness import Harness
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--files', type=int, default=5, help='number of files opened')
+    parser.add_argument('--backends', type=int, default=1, help='number of stub backends')
+    parser.add_argument('--chars', type=int, default=200, help='characters typed per file')
+    parser.add_argument('--complete-every', type=int, default=20, help='characters typed between completion requests')
+    parser.add_argument('--options', type=int, default=50, help='completion options per response')
+    args = parser.parse_args()
+
+    harness = Harness(backends=args.backends, options=args.options)
+    try:
+        # load:
+        views = [harness.open('file%d.stub' % index, 'def f%d():\n    pass\n' % index, index % args.backends) for index in range(args.files)]
+        connected = harness.wait_connected()
+        if connected is None:
+            raise SystemExit('Backends did not connect.')
+        harness.latency.record('connect (end to end)', connected)
+
+        for view in views:
+            harness.activate(view)
+
+            # edit, sync and complete:
+            typed = 0
+            while typed < args.chars:
+                chunk = min(args.complete_every, args.chars - typed)
+                harness.type(view, 'x' * (chunk - 1) + '.')
+                typed += chunk
+                harness.run(0.01)
+                harness.complete(view)
+
+            # problems, from typing until the annotation shows:
+            started = time.perf_counter()
+            harness.type(view, '\nerror')
+            waited = harness.wait_until(lambda: view.get_regions('jep-marker'), 5.0)
+            harness.latency.record('problems (end to end)', waited if waited is not None else time.perf_counter() - started)
+
+        # save as, the file shown before must no longer be synchronized:
+        view = views[0]
+        old_name = view.file_name()
+        harness.save_as(view, 'renamed.stub')
+        harness.type(view, 'x')
+        harness.run(0.1)
+        manager = harness.manager
+        if old_name in manager.content_tracker.tracked_files or manager.registry.entry_for_file(old_name):
+            raise SystemExit('File %s is still tracked after save as.' % old_name)
+
+        # close:
+        for view in views:
+            harness.close(view)
+        harness.run(0.1)
+
+        print(harness.latency.format_table())
+    finally:
+        harness.shutdown()
+
+
+if __name__ == '__main__':
+    main()
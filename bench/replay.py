@@ -0,0 +1,117 @@
+"""Replays a session recorded in Sublime ("JEP: Start Session Recording") against stub backends.
+
+Each ``.jep`` file of the recording is served by its own stub backend, recorded files are recreated with their recorded
+content. Callbacks are fed to the plugin at the recorded times, divided by ``--speed``; ``--speed 0`` replays without
+waiting. Prints the latency of each callback, the completion latency measured while recording and the number of backend
+messages of each type received while recording and while replaying.
+
+    python bench/replay.py ~/.config/sublime-text-3/Cache/JEP/recordings/session-20260101-120000.jepsession --speed 2
+"""
+import argparse
+import collections
+import os
+import time
+from harness import Harness, load_plugin_module
+from jep_py.frontend import BackendListener
+
+recording = load_plugin_module('jep_sublime.recording')
+
+
+class MessageCounter(BackendListener):
+    """Counts messages received from backends by type, like they are recorded."""
+
+    def __init__(self):
+        self.counts = collections.Counter()
+
+    def on_out_of_sync(self, out_of_sync, context):
+        self.counts['OutOfSync'] += 1
+
+    def on_content_sync(self, content_sync, context):
+        self.counts['ContentSync'] += 1
+
+    def on_problem_update(self, problem_update, context):
+        self.counts['ProblemUpdate'] += 1
+
+    def on_completion_response(self, completion_response, context):
+        self.counts['CompletionResponse'] += 1
+
+    def on_static_syntax_list(self, format_, syntaxes, context):
+        self.counts['StaticSyntaxList'] += 1
+
+
+def replay(events, harness, speed):
+    configs = []
+    views = {}
+    recorded_messages = collections.Counter()
+    started = time.monotonic()
+    for event in events:
+        timestamp, kind, view_id = event[:3]
+        args = event[3:]
+        if speed:
+            harness.run(max(0.0, started + timestamp / 1000 / speed - time.monotonic()))
+        else:
+            harness.run(0)
+
+        view = views.get(view_id)
+        if kind == recording.OPEN:
+            filename, content, config_file_path = args
+            if config_file_path not in configs:
+                configs.append(config_file_path)
+            name = '%d-%s.stub' % (len(views), os.path.basename(filename))
+            views[view_id] = harness.add_view(name, content, configs.index(config_file_path) % len(harness.project_dirs))
+        elif kind == recording.LOAD:
+            harness.load(view)
+        elif kind == recording.ACTIVATED:
+            harness.activate(view)
+        elif kind == recording.MODIFIED:
+            harness.modify(view, *args)
+        elif kind == recording.SELECTION:
+            harness.select(view, *args)
+        elif kind == recording.COMPLETIONS:
+            prefix, pos, duration_ms = args
+            harness.complete(view, prefix, pos)
+            harness.latency.record('recorded on_query_completions', duration_ms / 1000)
+        elif kind == recording.SAVE:
+            harness.save(view)
+        elif kind == recording.CLOSE:
+            harness.close(view)
+        elif kind == recording.BACKEND:
+            recorded_messages[args[0]] += 1
+    return recorded_messages
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('recording', help='recorded session file')
+    parser.add_argument('--speed', type=float, default=1.0, help='replay speed relative to recording, 0 to replay without waiting')
+    parser.add_argument('--options', type=int, default=50, help='completion options per stub response')
+    parser.add_argument('--settle', type=float, default=1.0, help='seconds to keep polling after the last event')
+    args = parser.parse_args()
+
+    events = recording.load_recording(args.recording)['events']
+    backends = len({event[5] for event in events if event[1] == recording.OPEN}) or 1
+
+    harness = Harness(backends=backends, options=args.options)
+    counter = MessageCounter()
+    try:
+        # the connection manager is usually created with the first view handled by JEP, it is needed to count messages:
+        harness.listener.create_backend_adapter('replay')
+        harness.manager.add_listener(counter)
+
+        started = time.perf_counter()
+        recorded_messages = replay(events, harness, args.speed)
+        harness.run(args.settle)
+        elapsed = time.perf_counter() - started
+
+        print('Replayed %d events in %.1f seconds (recorded: %.1f seconds).' % (len(events), elapsed, events[-1][0] / 1000 if events else 0))
+        print(harness.latency.format_table())
+        print()
+        print('%-24s %9s %9s' % ('backend message', 'recorded', 'replayed'))
+        for name in sorted(set(recorded_messages) | set(counter.counts)):
+            print('%-24s %9d %9d' % (name, recorded_messages[name], counter.counts[name]))
+    finally:
+        harness.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,179 @@
+"""Soak benchmark: many views across many stub backends under continuous synthetic typing.
+
+Opens ``--views`` views spread over ``--backends`` backends and types into them at ``--rate`` characters per second,
+switching the active view every ``--switch-every`` seconds. Every ``--interval`` seconds the duration of the connection
+poll ticks, the share of time the UI thread was blocked, the content sync bytes per second and the memory use are sampled.
+
+    python bench/soak.py --views 300 --backends 6 --duration 60
+    python bench/soak.py --sweep 25,50,100,200,300 --backends 6 --duration 20 --plot scaling.png
+
+With ``--sweep`` one run per number of views is made and a summary row per run is printed, showing the scaling curve.
+"""
+import argparse
+import itertools
+import time
+from harness import Harness, percentile
+
+WORDS = ('self', 'value', 'result', 'index', 'error_count', 'items', 'name', 'return', 'None', 'append')
+
+
+def memory_mb(tracemalloc):
+    if tracemalloc:
+        return tracemalloc.get_traced_memory()[0] / 2 ** 20
+    import resource
+    # maximum resident set size, in kilobytes on Linux:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def synced_bytes(harness):
+    return sum(con.outbound_stats['bytes'] for con in harness.manager.registry.connections())
+
+
+def soak(args, num_views, tracemalloc=None):
+    """Runs one soak and returns the list of samples."""
+    harness = Harness(backends=args.backends, options=args.options, settings={'max_live_backends': 0})
+    try:
+        content = ''.join('    line %d = value.attribute(%d)\n' % (line, line) for line in range(args.lines))
+        views = [harness.open('file%d.stub' % index, content, index % args.backends) for index in range(num_views)]
+        if harness.wait_connected(timeout=60) is None:
+            raise SystemExit('Backends did not connect.')
+        harness.run(1.0)
+
+        ticks = harness.latency.samples.setdefault('timer run_periodically', [])
+        text = itertools.cycle(' '.join(itertools.islice(itertools.cycle(WORDS), 1000)) + '\n')
+        started = time.monotonic()
+        next_char = next_sample = next_switch = started
+        sample_ticks, sample_busy, sample_bytes, sample_memory = len(ticks), harness.busy_seconds, synced_bytes(harness), memory_mb(tracemalloc)
+        memory_start = sample_memory
+        view_cycle = itertools.cycle(views)
+        view = None
+        typed = 0
+        samples = []
+        while True:
+            now = time.monotonic()
+            if now - started >= args.duration:
+                break
+            if now >= next_switch:
+                view = next(view_cycle)
+                harness.activate(view)
+                next_switch += args.switch_every
+            if now >= next_char:
+                harness.type(view, next(text))
+                typed += 1
+                if args.complete_every and typed % args.complete_every == 0:
+                    harness.complete(view)
+                next_char += 1 / args.rate
+            if now >= next_sample + args.interval:
+                interval = now - next_sample
+                tick_durations = sorted(ticks[sample_ticks:]) or [0.0]
+                memory = memory_mb(tracemalloc)
+                samples.append({
+                    'elapsed': now - started,
+                    'ticks': len(ticks) - sample_ticks,
+                    'tick_mean_ms': 1000 * sum(tick_durations) / len(tick_durations),
+                    'tick_p95_ms': 1000 * percentile(tick_durations, 0.95),
+                    'tick_max_ms': 1000 * tick_durations[-1],
+                    'busy_pct': 100 * (harness.busy_seconds - sample_busy) / interval,
+                    'sync_bytes_s': (synced_bytes(harness) - sample_bytes) / interval,
+                    'memory_mb': memory,
+                    'memory_growth_mb': memory - memory_start,
+                })
+                sample_ticks, sample_busy, sample_bytes = len(ticks), harness.busy_seconds, synced_bytes(harness)
+                next_sample = now
+            harness.run(max(0.0, min(next_char, next_switch, next_sample + args.interval) - time.monotonic()))
+        return samples
+    finally:
+        harness.shutdown()
+
+
+#: Table columns as sample key, header and format.
+COLUMNS = (('elapsed', 'time s', '%8.1f'), ('ticks', 'ticks', '%6d'), ('tick_mean_ms', 'tick ms', '%9.2f'), ('tick_p95_ms', 'p95 ms', '%9.2f'),
+           ('tick_max_ms', 'max ms', '%9.2f'), ('busy_pct', 'busy %', '%7.1f'), ('sync_bytes_s', 'sync B/s', '%10.0f'),
+           ('memory_mb', 'mem MB', '%9.1f'), ('memory_growth_mb', 'growth MB', '%9.1f'))
+
+
+def format_table(rows, first_column=None):
+    columns = ((first_column,) if first_column else ()) + COLUMNS
+    widths = [len(fmt % 0) for _, _, fmt in columns]
+    lines = [' '.join(header.rjust(width) for (_, header, _), width in zip(columns, widths))]
+    for row in rows:
+        lines.append(' '.join(fmt % row[name] for name, _, fmt in columns))
+    return '\n'.join(lines)
+
+
+def summarize(num_views, samples):
+    """Reduces samples of a run to a single row."""
+    count = len(samples) or 1
+    return {
+        'views': num_views,
+        'elapsed': samples[-1]['elapsed'] if samples else 0.0,
+        'ticks': sum(sample['ticks'] for sample in samples),
+        'tick_mean_ms': sum(sample['tick_mean_ms'] for sample in samples) / count,
+        'tick_p95_ms': max([sample['tick_p95_ms'] for sample in samples] or [0.0]),
+        'tick_max_ms': max([sample['tick_max_ms'] for sample in samples] or [0.0]),
+        'busy_pct': sum(sample['busy_pct'] for sample in samples) / count,
+        'sync_bytes_s': sum(sample['sync_bytes_s'] for sample in samples) / count,
+        'memory_mb': samples[-1]['memory_mb'] if samples else 0.0,
+        'memory_growth_mb': samples[-1]['memory_growth_mb'] if samples else 0.0,
+    }
+
+
+def plot(path, x_name, rows):
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as pyplot
+    except ImportError:
+        print('matplotlib is not available, no plot written.')
+        return
+
+    names = ('tick_mean_ms', 'tick_max_ms', 'busy_pct', 'sync_bytes_s', 'memory_growth_mb')
+    figure, axes = pyplot.subplots(len(names), 1, sharex=True, figsize=(8, 2.2 * len(names)))
+    x = [row[x_name] for row in rows]
+    for axis, name in zip(axes, names):
+        axis.plot(x, [row[name] for row in rows], marker='o')
+        axis.set_ylabel(name)
+    axes[-1].set_xlabel(x_name)
+    figure.tight_layout()
+    figure.savefig(path)
+    print('Plot written to %s.' % path)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--views', type=int, default=300, help='number of views opened')
+    parser.add_argument('--sweep', help='comma separated numbers of views, one run each')
+    parser.add_argument('--backends', type=int, default=6, help='number of stub backends')
+    parser.add_argument('--lines', type=int, default=200, help='lines per file')
+    parser.add_argument('--rate', type=float, default=10.0, help='characters typed per second')
+    parser.add_argument('--complete-every', type=int, default=25, help='characters typed between completion requests, 0 for none')
+    parser.add_argument('--switch-every', type=float, default=5.0, help='seconds between switches of the active view')
+    parser.add_argument('--options', type=int, default=50, help='completion options per response')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds of typing per run')
+    parser.add_argument('--interval', type=float, default=5.0, help='seconds between samples')
+    parser.add_argument('--trace-memory', action='store_true', help='measure Python heap with tracemalloc instead of maximum RSS')
+    parser.add_argument('--plot', help='file to write a plot of the results to, needs matplotlib')
+    args = parser.parse_args()
+
+    tracemalloc = None
+    if args.trace_memory:
+        import tracemalloc
+        tracemalloc.start()
+
+    if args.sweep:
+        rows = []
+        for num_views in [int(count) for count in args.sweep.split(',')]:
+            rows.append(summarize(num_views, soak(args, num_views, tracemalloc)))
+            print('%d views done.' % num_views)
+        print(format_table(rows, ('views', 'views', '%6d')))
+        if args.plot:
+            plot(args.plot, 'views', rows)
+    else:
+        samples = soak(args, args.views, tracemalloc)
+        print(format_table(samples))
+        if args.plot:
+            plot(args.plot, 'elapsed', samples)
+
+
+if __name__ == '__main__':
+    main()
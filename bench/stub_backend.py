@@ -0,0 +1,51 @@
+"""JEP backend answering with synthetic data, started by the harness through ``.jep`` files.
+
+Completion requests are answered with ``--options`` options, after ``--delay-ms`` milliseconds. After each content sync the
+lines containing the word "error" are reported as problems of the file.
+"""
+import argparse
+import collections
+import collections.abc
+import logging
+import os
+import sys
+import time
+
+if not hasattr(collections, 'Hashable'):
+    # contrib/umsgpack predates the removal of the ABC aliases from collections:
+    collections.Hashable = collections.abc.Hashable
+sys.path.append(os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'contrib'))
+
+from jep_py.backend import Backend, FrontendListener
+from jep_py.schema import CompletionOption, CompletionResponse, FileProblems, Problem, ProblemUpdate, Severity
+
+
+class StubListener(FrontendListener):
+    def __init__(self, options, delay_ms):
+        self.options = options
+        self.delay_ms = delay_ms
+
+    def on_content_sync(self, content_sync, context):
+        content = context.content_monitor[content_sync.file] or ''
+        problems = [Problem('stub error', Severity.error, line) for line, text in enumerate(content.split('\n'), 1) if 'error' in text]
+        context.send_message(ProblemUpdate([FileProblems(content_sync.file, problems)], partial=True))
+
+    def on_completion_request(self, completion_request, context):
+        if self.delay_ms:
+            time.sleep(self.delay_ms / 1000)
+        options = [CompletionOption('option%d' % i, 'stub option %d' % i) for i in range(self.options)]
+        context.send_message(CompletionResponse(completion_request.pos, completion_request.pos, False, options, completion_request.token))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--options', type=int, default=20, help='number of completion options per response')
+    parser.add_argument('--delay-ms', type=int, default=0, help='delay of completion responses')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    Backend([StubListener(args.options, args.delay_ms)]).start()
+
+
+if __name__ == '__main__':
+    main()
@@ -1,11 +1,54 @@
 """Annotation of code in Sublime."""
+import collections
 import sublime
+from . import settings
 
 
 class ErrorAnnotator:
     def __init__(self, backend_adapter):
         self.backend_adapter = backend_adapter
-        self.errors_by_file = {}
+        #: Map from file name to list of ``[line, message]`` of its errors, lines starting at 0, least recently updated first.
+        self.errors_by_file = collections.OrderedDict()
+
+    def on_problem_update(self, problem_update):
+        """Stores problems reported by backend and returns the names of files whose problems changed."""
+        changed = set()
+        for file_problems in problem_update.fileProblems:
+            errors = [[problem.line - 1, problem.message] for problem in file_problems.problems]
+            if file_problems.start or file_problems.end is not None:
+                # only a slice of the file's problem list was updated:
+                old = self.errors_by_file.get(file_problems.file, [])
+                errors = old[:file_problems.start] + errors + (old[file_problems.end:] if file_problems.end is not None else [])
+            self.errors_by_file.pop(file_problems.file, None)
+            self.errors_by_file[file_problems.file] = errors
+            changed.add(file_problems.file)
+
+        if not problem_update.partial:
+            # files not mentioned in a complete update have no problems (any longer):
+            for filename in list(self.errors_by_file):
+                if filename not in changed:
+                    del self.errors_by_file[filename]
+                    changed.add(filename)
+
+        self._evict(changed)
+        return changed
+
+    def _evict(self, changed):
+        """Drops errors of the least recently updated files not shown in any view, above ``max_error_files`` files."""
+        excess = len(self.errors_by_file) - settings.get('max_error_files')
+        if excess > 0:
+            registry = self.backend_adapter.registry
+            for filename in [filename for filename in self.errors_by_file if not registry.entry_for_file(filename)][:excess]:
+                del self.errors_by_file[filename]
+                changed.discard(filename)
+
+    def has_errors(self, filename):
+        return bool(self.errors_by_file.get(filename))
+
+    def render(self, view):
+        """Shows stored errors of the view's file."""
+        if view.is_valid():
+            self.update_errors(view, self.errors_by_file.get(view.file_name(), []))
 
     def on_modified(self, view):
         text = view.substr(sublime.Region(0, view.size()))
@@ -37,10 +80,10 @@ class ErrorAnnotator:
         in_error_line = False
         for e in errors:
             if cur_line == e[0]:
-                view.set_status("jep-status", "Error: " + e[1])
+                self.backend_adapter.status_bar.set_status(view, "jep-status", "Error: " + e[1])
                 in_error_line = True
         if not in_error_line:
-            view.set_status("jep-status", "%d errors" % len(errors))
+            self.backend_adapter.status_bar.set_status(view, "jep-status", "%d errors" % len(errors))
 
     @staticmethod
     def cursor_line(view):
@@ -1,33 +1,143 @@
 """Code completion."""
 import datetime
 import logging
+import time
 
+from jep_py.frontend import State
 from jep_py.schema import CompletionRequest
 import sublime
-from .constants import FRONTEND_POLL_DURATION_MS
+from . import settings
+from .constants import FRONTEND_POLL_DURATION_MS, SNAPSHOT_STALE_MARKER
+from .index import CompletionIndex
+from .prefetch import CompletionPrefetcher
+from .profiling import Histogram, format_histograms
+from .ranking import format_option, rank_options
+from .snapshot import CompletionSnapshotCache
 
 _logger = logging.getLogger(__name__)
 
 
+class CachedCompletions:
+    """Options received for the word starting at ``start`` of a file, valid while that word is being typed."""
+
+    __slots__ = ('filename', 'start', 'context', 'index')
+
+    def __init__(self, filename, start, context, index):
+        self.filename = filename
+        self.start = start
+        #: Line text in front of the word, see ``CompletionSnapshotCache.context``.
+        self.context = context
+        self.index = index
+
+    def matches(self, filename, start, context):
+        return filename == self.filename and start == self.start and context == self.context
+
+
 class Autocompleter:
+    """Serves completion requests from the file's backend.
+
+    While the backend is starting or restarting, or does not respond in time, the options last received for the same context
+    are served from the completion snapshots instead, marked as stale.
+
+    Backends may answer with many thousands of options, so only the ``completion_max_results`` options best matching the
+    typed prefix are formatted and passed to Sublime. The options of the last response are indexed and cached, so while
+    the same word is typed on, each new character narrows them down without another request to the backend.
+    """
+
     def __init__(self, backend_adapter):
         self.backend_adapter = backend_adapter
+        self.prefetcher = CompletionPrefetcher(backend_adapter)
+        #: Options of the last response with their index, ``None`` if there is none or it no longer applies.
+        self.cached = None
+        #: Time spent ranking the options of a response.
+        self.ranking = Histogram()
+        #: Time spent building the index of a response on the main thread.
+        self.indexing = Histogram()
+        #: Counters of responses, options received, options passed to Sublime and requests answered from the cache.
+        self.stats = {'responses': 0, 'options': 0, 'returned': 0, 'cached': 0}
 
     def on_query_completions(self, view, prefix, locations):
         result = []
 
         con = self.backend_adapter.get_connection_for_view(view)
         if con:
-            # Prefix passed in from Sublime not used here, as backend is expected to have full view of file content.
-            response = con.request_message(CompletionRequest(file=view.file_name(), pos=locations[0]), datetime.timedelta(milliseconds=FRONTEND_POLL_DURATION_MS))
-            if response:
-                for option in response.options:
-                    result.append(['%s\t%s' % (option.insert, option.desc), option.insert])
-            else:
+            filename = view.file_name()
+            pos = locations[0]
+            snapshots = self.backend_adapter.completion_snapshots if settings.get('completion_snapshots') else None
+            context = CompletionSnapshotCache.context(view, prefix, pos)
+            max_results = settings.get('completion_max_results')
+            max_length = settings.get('completion_description_max_length')
+
+            cached = self.cached
+            if cached and cached.matches(filename, pos - len(prefix), context):
+                # still typing the same word, the options of its response are narrowed down without asking the backend:
+                self.stats['cached'] += 1
+                options = self.rank(cached.index, prefix, max_results)
+                return [format_option(insert, desc, max_length) for insert, desc in options], sublime.INHIBIT_WORD_COMPLETIONS
+
+            timeout = datetime.timedelta(milliseconds=FRONTEND_POLL_DURATION_MS)
+            prefetched, response = self.prefetcher.take(con, filename, pos - len(prefix), context, timeout)
+            if not prefetched and con.state is State.Connected:
+                # make sure the backend sees the current content:
+                self.backend_adapter.flush_content(view)
+
+                # Prefix passed in from Sublime not used here, as backend is expected to have full view of file content.
+                response = con.request_message(CompletionRequest(file=filename, pos=pos), timeout)
+            if con.state is State.Connected and not response:
                 _logger.warning('No completion response received.')
+
+            if response:
+                index = self.index(response)
+                # a response limited by the backend may lack options matching the next typed characters:
+                self.cached = None if response.limitExceeded else CachedCompletions(filename, pos - len(prefix), context, index)
+                options = self.rank(index, prefix, max_results)
+                if snapshots:
+                    snapshots.store(filename, context, options)
+                result = [format_option(insert, desc, max_length) for insert, desc in options]
+            elif snapshots:
+                # backend not (yet) able to answer, serve what it said last time:
+                options = rank_options(snapshots.lookup(filename, context) or [], prefix, max_results)
+                result = [format_option(insert, desc, max_length, SNAPSHOT_STALE_MARKER) for insert, desc in options]
         else:
             _logger.warning('Completion request cannot be served, no connection for file %s.' % view.file_name())
 
         # INHIBIT_WORD_COMPLETIONS: prevent dummy code completion, i.e. do not simply offer any words found in document
         # INHIBIT_EXPLICIT_COMPLETIONS: prevent completions from completion files
         return result, sublime.INHIBIT_WORD_COMPLETIONS
+
+    def on_modified(self, view, filename, con):
+        self.prefetcher.on_modified(view, filename, con)
+
+    def forget(self, filename):
+        """Drops the cached options and pending prefetch if they are for given file."""
+        if self.cached and self.cached.filename == filename:
+            self.cached = None
+        self.prefetcher.forget(filename)
+
+    def index(self, response):
+        """Returns the index of the options of a response, usually built on the inbound reader thread already."""
+        started = time.perf_counter()
+        prebuilt = getattr(response, 'index', None) is not None
+        index = CompletionIndex.of(response)
+        if not prebuilt:
+            self.indexing.add(time.perf_counter() - started)
+
+        stats = self.stats
+        stats['responses'] += 1
+        stats['options'] += len(index)
+        return index
+
+    def rank(self, index, prefix, limit):
+        """Returns the best ``limit`` options of given index as ``(insert, desc)``, measuring the time taken."""
+        started = time.perf_counter()
+        options = index.query(prefix, limit)
+        self.ranking.add(time.perf_counter() - started)
+        self.stats['returned'] += len(options)
+        return options
+
+    def report(self):
+        """Returns report of the ranking of completion options."""
+        stats = self.stats
+        return '%s\n%d responses, %d options received, %d passed to Sublime (at most %d per request), %d requests answered from cache' % (
+            format_histograms({'rank completion options': self.ranking, 'index completion options': self.indexing}), stats['responses'],
+            stats['options'], stats['returned'], settings.get('completion_max_results'), stats['cached']) + '\n' + self.prefetcher.report()
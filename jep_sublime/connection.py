@@ -1,15 +1,32 @@
 """Infrastructure to connect Sublime and JEP."""
 import datetime
+import functools
 import logging
 import os
+import time
 import sublime
-from jep_py.frontend import BackendListener, Frontend, State
-from jep_py.schema import StaticSyntaxRequest, SyntaxFormatType
+from jep_py.frontend import BackendListener, State
+from jep_py.schema import CompletionResponse, StaticSyntaxRequest, SyntaxFormatType
+from . import settings
 from .annotation import ErrorAnnotator
 from .completion import Autocompleter
-from .constants import FRONTEND_POLL_DURATION_MS, FRONTEND_POLL_PERIOD_MS, STATUS_CATEGORY, STATUS_FORMAT
+from .constants import BACKGROUND_WORK_BUDGET_MS, FRONTEND_POLL_DURATION_MS, OUTBOUND_DRAIN_PERIOD_MS, STATUS_CATEGORY, STATUS_FORMAT
 from .content import Tracker
+from .inbound import InboundReader
+from .metrics import format_counters
+from .index import CompletionIndex
+from .prewarm import Prewarmer
+from .priority import FOREGROUND, HIDDEN, WorkQueue, view_ranks
+from .reaper import BackendReaper
+from .registry import ConnectionRegistry
+from .resolution import CachingServiceConfigProvider
+from .scheduler import SyncScheduler
+from .snapshot import CompletionSnapshotCache
+from .status import StatusBar
+from .supervisor import BackendSupervisor
 from .syntax import SyntaxManager
+from .tracing import trace
+from .transport import SublimeBackendConnection, SublimeFrontend
 
 _logger = logging.getLogger(__name__)
 
@@ -17,99 +34,360 @@ _logger = logging.getLogger(__name__)
 class ConnectionManager(BackendListener):
     """Manages connections between Sublime and JEP backends. Maps views and files in Sublime to JEP connections."""
 
-    def __init__(self, content_tracker=None, syntax_manager=None, auto_completer=None, error_annotator=None):
-        self._frontend = Frontend([self])
-        #: Map from connection to supported views.
-        self._connection_views_map = {}
-        self._file_connection_map = {}
+    def __init__(self, content_tracker=None, syntax_manager=None, auto_completer=None, error_annotator=None, service_config_provider=None,
+                 sync_scheduler=None, completion_snapshots=None):
+        #: Reader decoding backend messages on a worker thread, ``None`` if they are decoded on the main thread.
+        self.inbound_reader = InboundReader() if settings.get('decode_on_worker_thread') else None
+        if self.inbound_reader:
+            self.inbound_reader.preparers[CompletionResponse] = CompletionIndex.prepare
+        self.supervisor = BackendSupervisor(self)
+        self._frontend = SublimeFrontend([self], service_config_provider=service_config_provider or CachingServiceConfigProvider(),
+                                         provide_backend_connection=SublimeBackendConnection, inbound_reader=self.inbound_reader,
+                                         supervisor=self.supervisor)
+        #: Association of views and files to connections.
+        self.registry = ConnectionRegistry()
 
         self.content_tracker = content_tracker or Tracker()
-        self.syntax_manager = syntax_manager or SyntaxManager(os.path.join(sublime.packages_path(), 'jep'))
+        self.sync_scheduler = sync_scheduler or SyncScheduler()
+        self._syntax_manager = syntax_manager
+        self.completion_snapshots = completion_snapshots or CompletionSnapshotCache()
         self.auto_completer = auto_completer or Autocompleter(self)
         self.error_annotator = error_annotator or ErrorAnnotator(self)
+        self.prewarmer = Prewarmer(self, self._frontend.service_config_provider)
+        self.reaper = BackendReaper(self)
+        self.status_bar = StatusBar()
+        #: Deferred view updates, run in order of the views' focus.
+        self.work = WorkQueue()
+
+        #: Is periodic polling of connections active? Suspended while there is no connection.
+        self._polling = False
+        #: Whether anything happened since the last poll, keeps the poll period short.
+        self._active = False
+        #: Monotonic time the armed synchronization timer fires, ``None`` if no timer is armed.
+        self._sync_timer_at = None
+        #: Is a timer armed to write data the sockets did not accept yet?
+        self._drain_timer_armed = False
+        #: Connections shutting down, polled until disconnected.
+        self._retiring = set()
+        #: Monotonic time connection metrics were last logged.
+        self._metrics_logged_at = time.monotonic()
+        #: Counters of the event listener's ``on_modified`` hot path, reported with the other counters.
+        self.listener_stats = {}
+
+    @property
+    def syntax_manager(self):
+        """Syntax manager, created on first use as it scans the local syntax files."""
+        if not self._syntax_manager:
+            self._syntax_manager = SyntaxManager(os.path.join(sublime.packages_path(), 'jep'))
+        return self._syntax_manager
+
+    def add_listener(self, listener):
+        """Adds listener to the messages received from all backends."""
+        self._frontend.listeners.append(listener)
+
+    def remove_listener(self, listener):
+        self._frontend.listeners.remove(listener)
 
     def connect(self, view):
-        self._get_or_create_connection_for_view(view)
-        self.content_tracker.start_change_tracking(view)
+        con = self._get_or_create_connection_for_view(view)
+        if con:
+            con.last_used = time.monotonic()
+            filename = view.file_name()
+            self.content_tracker.start_change_tracking(filename)
+            if self.content_tracker.is_modified(filename) and not self.sync_scheduler.is_pending(filename):
+                self.sync_scheduler.schedule_now(filename)
+            self._active = True
+            self._ensure_polling()
+
+            if self.error_annotator.has_errors(filename):
+                self.work.submit(('annotate', view.id()), view.id(), functools.partial(self.error_annotator.render, view))
+            # view may have been activated, do what was postponed while it was in the background:
+            self.work.run_for_view(view.id())
+            self.status_bar.on_activated(view)
+
+    def connect_service(self, service_config):
+        """Connects to the backend of given service configuration without any view, e.g. to start it ahead of time."""
+        con = self._frontend.get_service_connection(service_config)
+        if con:
+            self.registry.add_connection(con)
+            self._active = True
+            self._ensure_polling()
+        return con
+
+    def retire_connection(self, con):
+        """Shuts down the backend of given connection and forgets the connection together with all views it serves."""
+        for view in self.registry.views_for_connection(con):
+            self.status_bar.erase_status(view, STATUS_CATEGORY)
+            self._detach(view.id())
+        self.registry.remove_connection(con)
+        self._frontend.release_connection(con)
+        if con.state is not State.Disconnected:
+            con.disconnect()
+            self._retiring.add(con)
 
     def disconnect(self, view):
-        if 0 == self._release_connection_for_view(view):
-            # this was the last view using this connection, no need to track any longer:
-            self.content_tracker.stop_change_tracking(view)
+        self._detach(view.id())
+
+    def _detach(self, view_id):
+        self.work.discard_view(view_id)
+        self.status_bar.forget_view(view_id)
+        entry = self.registry.detach(view_id)
+        if entry and not entry.view_ids:
+            # this was the last view showing this file, no need to track any longer:
+            self.content_tracker.stop_change_tracking(entry.filename)
+            self.sync_scheduler.forget(entry.filename)
+            self.auto_completer.forget(entry.filename)
+            entry.connection.release_content(entry.filename, settings.get('max_closed_file_shadows'))
 
     def mark_content_modified(self, view):
-        self.content_tracker.mark_content_modified(view)
+        entry = self.registry.entry_for_view(view.id())
+        if entry:
+            self.content_tracker.mark_content_modified(entry.filename)
+            self.sync_scheduler.on_edit(entry.filename)
+            self._arm_sync_timer()
+            self.auto_completer.on_modified(view, entry.filename, entry.connection)
+
+    def flush_content(self, view):
+        """Synchronizes pending modifications of the view's file right away, to be called before content dependent requests.
+
+        The content sync is queued on the connection and written together with the request sent next, which flushes the
+        connection's queue.
+        """
+        entry = self.registry.entry_for_view(view.id())
+        if entry and self.content_tracker.is_modified(entry.filename):
+            self._synchronize(entry.filename, flushed=True)
 
     def _get_or_create_connection_for_view(self, view):
+        filename = view.file_name()
+
         # do we already have a connection for this view?
-        con = self.get_connection_for_view(view)
+        entry = self.registry.entry_for_view(view.id())
+        if entry and entry.filename == filename:
+            return entry.connection
+
+        # maybe the file is already shown in another view, e.g. a clone:
+        con = self.registry.connection_for_file(filename)
         if not con:
             # try to create one:
-            filename = view.file_name()
-            _logger.debug('Creating new connection for file %s.' % filename)
+            trace('Creating new connection for file %s.', filename)
             con = self._frontend.get_connection(filename)
-            if con:
-                self._file_connection_map[filename] = con
 
-                # maybe the connection is already up as it was used by another file:
-                views = self._connection_views_map.setdefault(con, [])
-                views.append(view)
-            else:
-                _logger.debug('Frontend did not identify backend for file.')
+        if con:
+            # the view showed another file before, e.g. after "save as", or the file moved to another backend:
+            for view_id in self.registry.stale_view_ids(view.id(), filename, con):
+                self._detach(view_id)
+            # maybe the connection is already up as it was used by another file:
+            self.registry.attach(view, filename, con)
+        else:
+            trace('Frontend did not identify backend for file %s.', filename)
 
         return con
 
     def get_connection_for_view(self, view):
         """Public API to get an exiting connection for a view or None."""
-        filename = view.file_name()
-        con = self._file_connection_map.get(filename)
-        return con
-
-    def _release_connection_for_view(self, view):
-        """Releases the connection for the given view and returns the number of views left using this connection."""
-        num_views_left = 0
-
-        _logger.debug('Number of connections:                %d' % len(self._connection_views_map))
-        _logger.debug('Number of files before:               %d' % len(self._file_connection_map))
-        filename = view.file_name()
-        con = self._file_connection_map.pop(filename, None)
-        _logger.debug('Number of files after:                %d' % len(self._file_connection_map))
-        if con:
-            views = self._connection_views_map[con]
-            _logger.debug('Number of views in connection before: %d' % len(views))
-            try:
-                views.remove(view)
-            except ValueError:
-                # Sublime changed views a bit too fast.
-                pass
-            num_views_left = len(views)
-            _logger.debug('Number of views in connection after:  %d' % num_views_left)
-
-        return num_views_left
+        return self.registry.connection_for_view(view.id()) or self.registry.connection_for_file(view.file_name())
 
     def run(self):
-        for con in self._connection_views_map.keys():
-            previous_state = con.state
+        self.prewarmer.start_pending()
+        self.supervisor.run()
+        if self.supervisor.restarting:
+            self._active = True
 
+        for con in self.registry.connections():
             con.run(datetime.timedelta(milliseconds=FRONTEND_POLL_DURATION_MS))
-            state = con.state
-
-            # update views' contents if modified:
-            views = self._connection_views_map[con]
-            for view in views.copy():
-                if view.is_valid():
-                    if state is State.Connected:
-                        self.content_tracker.synchronize_content(con, view)
-                else:
-                    _logger.warning('Found invalid view.')
-                    views.remove(view)
+            if con.state is State.Connecting or con.state is State.Disconnecting:
+                self._active = True
+
+        for con in list(self._retiring):
+            con.run(datetime.timedelta(milliseconds=FRONTEND_POLL_DURATION_MS))
+            if con.state is State.Disconnected:
+                self._retiring.discard(con)
+
+        ranks = view_ranks()
+        self.reaper.run(ranks)
+        self.completion_snapshots.save_if_due()
+        self._log_metrics_if_due()
+
+        self.synchronize_due_files(ranks)
+        self.work.run(ranks)
+        if self.work:
+            self._active = True
+
+    def _log_metrics_if_due(self):
+        period = settings.get('metrics_log_period_s')
+        now = time.monotonic()
+        if period and now - self._metrics_logged_at >= period:
+            self._metrics_logged_at = now
+            for con in self.registry.connections():
+                _logger.info('Backend %s: %s.' % (con.service_config.command, con.metrics.format_line()))
+            _logger.info('Counters: %s.' % '; '.join(self.counter_lines()))
+
+    def counter_lines(self):
+        """Returns a line of counters for each part of the plugin keeping them."""
+        scheduler_stats = dict(self.sync_scheduler.stats, idle_seconds=self.sync_scheduler.idle_seconds)
+        lines = [format_counters('on_modified', self.listener_stats),
+                 format_counters('sync scheduler', scheduler_stats),
+                 format_counters('deferred view work', self.work.stats),
+                 format_counters('status bar', self.status_bar.stats),
+                 format_counters('backend reaper', self.reaper.stats),
+                 format_counters('completion snapshots', self.completion_snapshots.stats)]
+        provider_stats = getattr(self._frontend.service_config_provider, 'stats', None)
+        if provider_stats is not None:
+            lines.append(format_counters('service configuration lookups', provider_stats))
+        for config, stats in sorted(self.supervisor.stats.items()):
+            lines.append(format_counters('restarts of %s' % config, stats))
+        for con in self.registry.connections():
+            lines.append(format_counters('outbound queue of %s' % con.service_config.command, con.outbound_stats))
+        return lines
+
+    def metrics_report(self):
+        """Returns report of the metrics of all connections."""
+        sections = []
+        for con in self.registry.connections():
+            sections.append('Backend %s (%s), %s\n\n%s' % (con.service_config.command, con.service_config.config_file_path, con.state.name,
+                                                            con.metrics.format()))
+        if sections:
+            sections.append(self.auto_completer.report())
+        sections.append('\n'.join(self.counter_lines()))
+        if sections and self.inbound_reader:
+            stats = self.inbound_reader.stats
+            sections.append('Inbound reader thread: %d bytes, %d messages decoded, dispatched in %d batches, %d queued' % (
+                stats['bytes'], stats['messages'], stats['dispatches'], self.inbound_reader.queue_depth))
+        if not self.registry.connections():
+            sections.insert(0, 'No backend connections.')
+        return '\n\n\n'.join(sections)
+
+    def shutdown(self):
+        """Stops the inbound reader thread, when the plugin is unloaded."""
+        if self.inbound_reader:
+            self.inbound_reader.stop()
+
+    def synchronize_due_files(self, ranks=None):
+        """Synchronizes files whose synchronization is due, those of the foreground view first.
+
+        Files only shown in the background are synchronized within the tick's budget of ``BACKGROUND_WORK_BUDGET_MS``, the
+        rest stays due for the next tick.
+        """
+        due = self.sync_scheduler.due_files()
+        if due:
+            started = time.perf_counter()
+            ranks = view_ranks() if ranks is None else ranks
+            budget = BACKGROUND_WORK_BUDGET_MS / 1000
+            for rank, filename in sorted((self._file_rank(filename, ranks), filename) for filename in due):
+                if rank != FOREGROUND and time.perf_counter() - started >= budget:
+                    self.sync_scheduler.stats['starved'] += 1
+                    self._active = True
+                    break
+                self._synchronize(filename)
+
+        # write all messages of this tick in one go per connection:
+        for con in self.registry.connections():
+            con.flush_outbound()
+
+        self._arm_sync_timer()
+        self._arm_drain_timer()
+
+    def _synchronize(self, filename, flushed=False):
+        """Synchronizes file content with backend if connected, reading it from any valid view of the file.
+
+        Scheduled synchronization is deferred while the connection's outbound queue is backlogged, content flushed ahead of a
+        request is queued to be written together with it.
+        """
+        entry = self.registry.entry_for_file(filename)
+        if not entry:
+            self.content_tracker.stop_change_tracking(filename)
+            self.sync_scheduler.forget(filename)
+        elif entry.connection.state is State.Connected:
+            if not flushed and entry.connection.backlogged:
+                self.sync_scheduler.defer(filename)
+                return
+
+            view = self.get_valid_view(entry)
+            if view:
+                trace('Synchronizing %s (%s).', filename, 'flushed' if flushed else 'scheduled')
+                self.content_tracker.synchronize_content(entry.connection, filename, view)
+                self.sync_scheduler.on_synchronized(filename, flushed)
+                self._active = True
+
+    def _file_rank(self, filename, ranks):
+        """Returns priority of file, the one of its most prominent view."""
+        entry = self.registry.entry_for_file(filename)
+        return min([ranks.get(view_id, HIDDEN) for view_id in entry.view_ids] or [HIDDEN]) if entry else HIDDEN
+
+    def get_valid_view(self, entry):
+        """Returns any valid view showing the file of given entry, detaching invalid ones on the way."""
+        for view_id in list(entry.view_ids):
+            view = self.registry.views[view_id]
+            if view.is_valid():
+                return view
+            _logger.warning('Found invalid view.')
+            self._detach(view_id)
+        return None
 
     def run_periodically(self):
+        self._polling = True
         self.run()
-        sublime.set_timeout(self.run_periodically, FRONTEND_POLL_PERIOD_MS)
+
+        if self.registry.connections() or self._retiring:
+            period = self.sync_scheduler.next_poll_period_ms(self._active)
+            self._active = False
+            sublime.set_timeout(self.run_periodically, period)
+        else:
+            # nothing to poll, stay idle until the next connection is made:
+            self._polling = False
+
+    def _ensure_polling(self):
+        if not self._polling:
+            self._polling = True
+            sublime.set_timeout(self.run_periodically, 0)
+
+    def _arm_sync_timer(self):
+        delay = self.sync_scheduler.next_sync_delay_ms()
+        if delay is None:
+            return
+
+        fire_at = time.monotonic() + delay / 1000
+        if self._sync_timer_at is not None and self._sync_timer_at <= fire_at:
+            # timer firing earlier re-arms for this one:
+            return
+
+        self._sync_timer_at = fire_at
+        sublime.set_timeout(self._on_sync_timer, delay)
+
+    def _arm_drain_timer(self):
+        """Keeps writing data not accepted by a socket yet, much more often than connections are polled."""
+        if not self._drain_timer_armed and any(con.draining for con in self.registry.connections()):
+            self._drain_timer_armed = True
+            sublime.set_timeout(self._on_drain_timer, OUTBOUND_DRAIN_PERIOD_MS)
+
+    def _on_drain_timer(self):
+        self._drain_timer_armed = False
+        for con in self.registry.connections():
+            if con.draining:
+                con.flush_outbound()
+        self._arm_drain_timer()
+
+    def _on_sync_timer(self):
+        self._sync_timer_at = None
+        self.synchronize_due_files()
+
+    def files_by_priority(self, con):
+        """Returns names of the files served by given connection, the file of the active view first."""
+        filenames = [entry.filename for entry in self.registry.entries_for_connection(con)]
+        window = sublime.active_window()
+        view = window.active_view() if window else None
+        entry = self.registry.entry_for_view(view.id()) if view else None
+        if entry and entry.connection is con:
+            filenames.remove(entry.filename)
+            filenames.insert(0, entry.filename)
+        return filenames
 
     def on_connection_state_changed(self, old_state, new_state, connection):
-        views = self._connection_views_map.get(connection)
+        self._active = True
+        if new_state is State.Disconnected:
+            self.supervisor.on_disconnected(connection)
+
+        views = self.registry.views_for_connection(connection)
         if views:
             for view in views:
                 if new_state is State.Connected:
@@ -118,23 +396,49 @@ class ConnectionManager(BackendListener):
                     status = "Connecting..."
                 elif new_state is State.Disconnecting:
                     status = "Disconnecting..."
+                elif new_state is State.Disconnected and self.supervisor.is_restarting(connection):
+                    status = "Backend died, restarting..."
                 elif new_state is State.Disconnected:
                     status = "Disconnected"
                 else:
                     status = "Internal error, unexpected connection state %s." % new_state
-                view.set_status(STATUS_CATEGORY, STATUS_FORMAT % status)
-                _logger.debug('Connection state changed to {}.'.format(status))
+                self.work.submit(('status', view.id()), view.id(), functools.partial(self.status_bar.set_status, view, STATUS_CATEGORY, STATUS_FORMAT % status))
+                trace('Connection state of view %s changed to %s.', view.file_name(), status)
 
         if new_state is State.Connected:
+            # a restarted backend does not know any content yet, replay it with the active file first:
+            filenames = self.files_by_priority(connection)
+            connection.replay_content(filenames)
+            for filename in filenames:
+                self.auto_completer.forget(filename)
+            self.supervisor.on_connected(connection)
+
             # this is a new connection and possibly a new backend, so ask for any syntax definitions that are available:
-            _logger.debug('Querying backend for syntax definitions.')
+            trace('Querying backend %s for syntax definitions.', connection.service_config.command)
             connection.send_message(StaticSyntaxRequest(SyntaxFormatType.textmate))
 
+    def on_problem_update(self, problem_update, connection):
+        for filename in self.error_annotator.on_problem_update(problem_update):
+            for view in self.registry.views_for_file(filename):
+                self.work.submit(('annotate', view.id()), view.id(), functools.partial(self.error_annotator.render, view))
+
+    def on_out_of_sync(self, out_of_sync, connection):
+        filename = out_of_sync.file
+        _logger.info('Backend is out of sync for file %s, sending whole content.' % filename)
+        connection.forget_content(filename)
+        self.auto_completer.forget(filename)
+        self.content_tracker.mark_content_modified(filename)
+        self.sync_scheduler.schedule_now(filename)
+
     def on_static_syntax_list(self, format_, syntaxes, connection):
         if format_ is not SyntaxFormatType.textmate:
             _logger.debug('Ignoring {} syntax definitions in format {}.'.format(len(syntaxes), format_.name))
             return
 
+        # writing syntax files does not touch any view, so it is kept off the main thread:
+        sublime.set_timeout_async(functools.partial(self._install_syntaxes, syntaxes), 0)
+
+    def _install_syntaxes(self, syntaxes):
         install = self.syntax_manager.install_syntax
         for syntax in syntaxes:
             install(syntax.name, syntax.definition)
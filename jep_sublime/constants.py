@@ -2,4 +2,34 @@
 FRONTEND_POLL_DURATION_MS = 100
 FRONTEND_POLL_PERIOD_MS = 1000
 STATUS_CATEGORY = 'JEP'
-STATUS_FORMAT = 'JEP: %s'
\ No newline at end of file
+STATUS_FORMAT = 'JEP: %s'
+SERVICE_CONFIG_FILE_NAME = '.jep'
+SERVICE_CONFIG_CACHE_SIZE = 4096
+SERVICE_CONFIG_NEGATIVE_TTL_S = 60
+FRONTEND_IDLE_POLL_PERIOD_MS = 4000
+SYNC_DEBOUNCE_MIN_MS = 30
+SYNC_DEBOUNCE_MAX_MS = 400
+SYNC_DEBOUNCE_FACTOR = 1.5
+SYNC_EDIT_INTERVAL_SMOOTHING = 0.3
+SYNC_MAX_DELAY_MS = 1000
+SYNC_BACKPRESSURE_DELAY_MS = 200
+OUTBOUND_BACKLOG_DEPTH = 32
+RESTART_BACKOFF_MIN_MS = 500
+RESTART_BACKOFF_MAX_MS = 30000
+RESTART_STABLE_MS = 3000
+SNAPSHOT_FILE_NAME = 'completions.msgpack.z'
+SNAPSHOT_FORMAT_VERSION = 1
+SNAPSHOT_CONTEXT_LENGTH = 80
+SNAPSHOT_SAVE_PERIOD_S = 60
+SNAPSHOT_STALE_MARKER = ' (cached)'
+BACKGROUND_WORK_BUDGET_MS = 20
+RECORDING_FORMAT_VERSION = 1
+RECORDING_FILE_EXTENSION = '.jepsession'
+HISTOGRAM_MIN_S = 1e-6
+HISTOGRAM_FACTOR = 1.2
+HISTOGRAM_BUCKETS = 100
+TRACE_BUFFER_SIZE = 2000
+TRACE_DUMP_MIN_INTERVAL_S = 60
+INBOUND_SELECT_TIMEOUT_S = 0.05
+OUTBOUND_DRAIN_PERIOD_MS = 10
+COMPLETION_INDEX_BLOCK_SIZE = 4096
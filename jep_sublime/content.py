@@ -2,33 +2,71 @@
 from jep_py.schema import ContentSync
 import sublime
 
-# TODO: Change interface to filename, not view level. We are tracking the file content, not a particular view.
 
 class Tracker:
+    """Tracks modifications of file contents that need to be synchronized with the backend.
+
+    Tracking is done per file, not per view: a file shown in several views (clones, split panes) is synchronized once,
+    from any of its views.
+    """
+
     def __init__(self):
-        #: Map from filename to flag if backend buffer needs update.
-        self.file_modified_map = {}
+        #: Names of files being tracked.
+        self.tracked_files = set()
+        #: Names of tracked files whose backend buffer needs an update.
+        self.modified_files = set()
 
-    def start_change_tracking(self, view):
-        filename = view.file_name()
-        if filename not in self.file_modified_map:
+    def start_change_tracking(self, filename):
+        if filename not in self.tracked_files:
+            self.tracked_files.add(filename)
             # trigger initial content synchronization:
-            self.file_modified_map[filename] = True
+            self.modified_files.add(filename)
 
-    def stop_change_tracking(self, view):
-        filename = view.file_name()
-        if filename in self.file_modified_map:
-            self.file_modified_map.pop(filename)
+    def stop_change_tracking(self, filename):
+        self.tracked_files.discard(filename)
+        self.modified_files.discard(filename)
 
-    def mark_content_modified(self, view):
-        filename = view.file_name()
+    def mark_content_modified(self, filename):
         # Sublime seems to debounce this events, so this is no performance nightmare:
-        if filename in self.file_modified_map:
-            self.file_modified_map[filename] = True
-
-    def synchronize_content(self, connection, view):
-        """Synchronizes content with backend if modified."""
-        filename = view.file_name()
-        if self.file_modified_map.get(filename, False):
-            self.file_modified_map[filename] = False
-            connection.send_message(ContentSync(filename, view.substr(sublime.Region(0, view.size()))))
\ No newline at end of file
+        if filename in self.tracked_files:
+            self.modified_files.add(filename)
+
+    def is_modified(self, filename):
+        return filename in self.modified_files
+
+    def synchronize_content(self, connection, filename, view):
+        """Synchronizes content of file, read from the given view showing it, with backend if modified.
+
+        The message is tagged with the buffer's change count as content version.
+        """
+        if filename in self.modified_files:
+            self.modified_files.discard(filename)
+            message = ContentSync(filename, view.substr(sublime.Region(0, view.size())))
+            message.content_version = view.change_count()
+            connection.send_message(message)
+
+
+def content_delta(old, new):
+    """Returns ``(start, end, data)`` such that replacing ``old[start:end]`` by ``data`` yields ``new``, or ``None`` if equal.
+
+    Common prefix and suffix are found by bisection over slice comparisons, so the strings are compared at C speed.
+    """
+    if old == new:
+        return None
+
+    prefix = _common_length(old, new, min(len(old), len(new)), lambda s, lo, hi: s[lo:hi])
+    limit = min(len(old), len(new)) - prefix
+    suffix = _common_length(old, new, limit, lambda s, lo, hi: s[len(s) - hi:len(s) - lo])
+    return prefix, len(old) - suffix, new[prefix:len(new) - suffix]
+
+
+def _common_length(a, b, limit, part):
+    """Bisects the largest length up to ``limit`` for which the parts of both strings agree, comparing only untested parts."""
+    lo, hi = 0, limit
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if part(a, lo, mid) == part(b, lo, mid):
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
@@ -0,0 +1,161 @@
+"""Reading and decoding of backend messages on a worker thread."""
+import collections
+import datetime
+import functools
+import logging
+import select
+import threading
+import time
+import sublime
+from jep_py.config import BUFFER_LENGTH
+from jep_py.frontend import State
+from .constants import INBOUND_SELECT_TIMEOUT_S
+from .tracing import trace
+
+_logger = logging.getLogger(__name__)
+
+
+class InboundReader:
+    """Reads, frames and decodes the messages of all connected backends on a daemon thread.
+
+    Decoded messages are queued and dispatched to the listeners of their connection on Sublime's main thread, a whole
+    batch in a single ``sublime.set_timeout`` callback, so the main thread never waits for a socket or decodes a message.
+    A response to a pending request is also handed to its connection right away, waking the waiting request without a
+    detour through the main thread.
+
+    Connections are watched from the time they are connected until they are cleaned up. A socket closed by the backend is
+    only flagged here, the connection cleans up on the main thread. Data and errors of a socket the connection no longer
+    uses, as it was closed and possibly reconnected on the main thread meanwhile, are ignored.
+    """
+
+    def __init__(self):
+        #: Map from socket to watched connection, guarded by ``_lock``.
+        self._connections = {}
+        self._lock = threading.Lock()
+        #: Decoded messages as ``(connection, message)``, not dispatched yet.
+        self._inbound = collections.deque()
+        #: Is a dispatch of the queued messages scheduled on the main thread?
+        self._dispatch_scheduled = False
+        self._thread = None
+        self._stopped = False
+        #: Map from message type to function preparing a message on this thread before it is handed over, which may return
+        #: a function to be called on this thread afterwards, e.g. to build caches ahead of their use.
+        self.preparers = {}
+        #: Counters of received bytes, decoded messages and main thread dispatches.
+        self.stats = {'bytes': 0, 'messages': 0, 'dispatches': 0}
+
+    def watch(self, con):
+        """Starts reading from the socket of given connection, starting the thread on first use."""
+        with self._lock:
+            self._connections[con._socket] = con
+        if not self._thread:
+            self._stopped = False
+            self._thread = threading.Thread(target=self._run, name='JEP inbound reader')
+            self._thread.daemon = True
+            self._thread.start()
+
+    def unwatch(self, con, sock=None):
+        """Stops reading from the sockets of given connection, or only from given socket of it."""
+        with self._lock:
+            for watched_sock in [watched_sock for watched_sock, watched in self._connections.items() if watched is con]:
+                if sock is None or watched_sock is sock:
+                    del self._connections[watched_sock]
+
+    def stop(self):
+        """Stops the thread, messages still queued are dispatched nevertheless."""
+        self._stopped = True
+        if self._thread:
+            self._thread.join(2 * INBOUND_SELECT_TIMEOUT_S)
+            self._thread = None
+
+    @property
+    def queue_depth(self):
+        """Number of decoded messages waiting to be dispatched."""
+        return len(self._inbound)
+
+    def _run(self):
+        while not self._stopped:
+            with self._lock:
+                connections = dict(self._connections)
+            if not connections:
+                time.sleep(INBOUND_SELECT_TIMEOUT_S)
+                continue
+
+            try:
+                readable, _, _ = select.select(list(connections), [], [], INBOUND_SELECT_TIMEOUT_S)
+            except (OSError, ValueError):
+                # a socket was closed on the main thread in the meantime, it is no longer watched in the next cycle:
+                continue
+
+            for sock in readable:
+                try:
+                    self._receive(connections[sock], sock)
+                except Exception:
+                    _logger.exception('Failed to read message from backend %s.' % connections[sock].service_config.command)
+
+    def _receive(self, con, sock):
+        closed = False
+        received = []
+        try:
+            while True:
+                data = sock.recv(BUFFER_LENGTH)
+                if not data:
+                    closed = True
+                    break
+                received.append(data)
+        except BlockingIOError:
+            # no more data available for now:
+            pass
+        except OSError:
+            closed = True
+
+        if sock is not con._socket:
+            # the main thread closed this socket and may have connected anew, the events of the old one do not apply:
+            trace('Ignoring data of replaced socket of backend %s.', con.service_config.command)
+            self.unwatch(con, sock)
+            return
+
+        for data in received:
+            # any received message resets the timeout:
+            con._state_timer_reset = datetime.datetime.now()
+            con._serializer.enque_data(data)
+            self.stats['bytes'] += len(data)
+
+        messages = list(con._serializer)
+        followups = []
+        for message in messages:
+            prepare = self.preparers.get(type(message))
+            if prepare:
+                followups.append(prepare(message))
+            con.on_message_decoded(message)
+        self.stats['messages'] += len(messages)
+        self._inbound.extend((con, message) for message in messages)
+
+        # flag checked after queueing, as the dispatch clears it before taking messages off the queue:
+        if messages and not self._dispatch_scheduled:
+            self._dispatch_scheduled = True
+            sublime.set_timeout(self._dispatch, 0)
+
+        for followup in filter(None, followups):
+            followup()
+
+        if closed:
+            self.unwatch(con, sock)
+            con.on_inbound_closed(sock)
+            # let the connection clean up right away rather than with the next poll:
+            sublime.set_timeout(functools.partial(con.run, datetime.timedelta(0)), 0)
+
+    def _dispatch(self):
+        """Runs the listeners of the queued messages, on the main thread."""
+        self._dispatch_scheduled = False
+        self.stats['dispatches'] += 1
+        inbound = self._inbound
+        while inbound:
+            con, message = inbound.popleft()
+            if con.state is not State.Connected and con.state is not State.Disconnecting:
+                trace('Dropping %s of disconnected backend %s.', type(message).__name__, con.service_config.command)
+                continue
+            try:
+                con.dispatch_message(message)
+            except Exception:
+                _logger.exception('Failed to handle %s from backend %s.' % (type(message).__name__, con.service_config.command))
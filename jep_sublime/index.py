@@ -0,0 +1,181 @@
+"""Index over the options of a completion response."""
+import bisect
+import string
+from .constants import COMPLETION_INDEX_BLOCK_SIZE
+from .ranking import is_subsequence
+
+#: Character sorting after any other, to find the end of the range of keys starting with a prefix.
+_MAX_CHAR = chr(0x10ffff)
+#: Byte table mapping zero to zero and any other byte to one, to find the nonzero bytes of a bit set with ``bytes.find``.
+_NONZERO = bytes([0] + [1] * 255)
+#: Offsets of the set bits of each byte value.
+_SET_BITS = [tuple(bit for bit in range(8) if value >> bit & 1) for value in range(256)]
+#: Line separator of the joined option text.
+_NEWLINE = ord('\n')
+
+
+def _digits_table(byte):
+    """Returns byte table mapping given byte to ``'1'`` and any other byte to ``'0'``."""
+    return bytes([0x31 if other == byte else 0x30 for other in range(256)])
+
+
+class _Block:
+    """Fuzzy matching over a block of consecutive options, see ``CompletionIndex``."""
+
+    __slots__ = ('first', '_reversed_text', '_ends', '_length', '_newlines', '_bits_by_byte', '_query', '_matches')
+
+    def __init__(self, first, lines):
+        #: Index of the block's first option.
+        self.first = first
+        #: Joined text reversed, so bit ``i`` of a bit set parsed from it stands for byte ``i`` of the text.
+        self._reversed_text = b''.join(line + b'\n' for line in lines)[::-1]
+        #: Position of the line end of each option in the joined text.
+        self._ends = ends = []
+        end = -1
+        for line in lines:
+            end += len(line) + 1
+            ends.append(end)
+        #: Number of bytes of a bit set.
+        self._length = end // 8 + 1
+        self._newlines = self._parse_bits(_NEWLINE)
+        #: Map from byte to integer whose bit ``i`` is set if byte ``i`` of the joined text is that byte.
+        self._bits_by_byte = {}
+        #: Last query and the match of each of its prefixes, bit ``i`` of a match is set if the text up to byte ``i`` ends
+        #: with a match of the query prefix.
+        self._query = b''
+        self._matches = []
+
+    def search(self, query, encoded, lowered, needed):
+        """Returns indexes of up to ``needed`` options of the block containing the characters of the lowercase ``query`` in
+        the same order but not starting with it, given the query encoded and the lowercase inserts of all options.
+        """
+        # continue from the longest common prefix with the last query:
+        last = self._query
+        if encoded.startswith(last):
+            common = len(last)
+        else:
+            common = 0
+            while common < len(encoded) and common < len(last) and encoded[common] == last[common]:
+                common += 1
+        matches = self._matches[:common]
+        for byte in encoded[common:]:
+            bits = self.bits(byte)
+            matches.append(self._following(matches[-1]) & bits if matches else bits)
+        self._query, self._matches = encoded, matches
+
+        found = []
+        match = matches[-1]
+        if not match:
+            return found
+
+        # bytes of other characters may match a query with non ASCII characters:
+        verify = len(encoded) != len(query)
+        data = match.to_bytes(self._length, 'little')
+        nonzero = data.translate(_NONZERO)
+        ends = self._ends
+        first = self.first
+        index = -1
+        offset = nonzero.find(1)
+        while offset >= 0:
+            for bit in _SET_BITS[data[offset]]:
+                position = offset * 8 + bit
+                # an option may match more than once:
+                if index < 0 or position > ends[index]:
+                    index = bisect.bisect_left(ends, position, index + 1)
+                    text = lowered[first + index]
+                    if not text.startswith(query) and (not verify or is_subsequence(query, text)):
+                        found.append(first + index)
+                        if len(found) == needed:
+                            return found
+            offset = nonzero.find(1, offset + 1)
+        return found
+
+    def _following(self, bits):
+        """Returns bit set of the positions after the first set bit of each line, up to the line end."""
+        # subtracting each bit borrows up to the next set bit, i.e. the next match or the line end, leaving the bits from
+        # the first match of a line on set but for the other matches, which the xor turns around:
+        return (self._newlines - bits) ^ bits
+
+    def bits(self, byte):
+        """Returns the bit set of given byte, built on first use."""
+        bits = self._bits_by_byte.get(byte)
+        if bits is None:
+            bits = self._bits_by_byte[byte] = self._parse_bits(byte)
+        return bits
+
+    def _parse_bits(self, byte):
+        return int(self._reversed_text.translate(_digits_table(byte)) or b'0', 2)
+
+
+class CompletionIndex:
+    """Answers prefix and fuzzy queries over the options of one completion response, while the user types on.
+
+    Lowercase inserts are kept sorted, so the options starting with a prefix are found by bisection. For fuzzy queries,
+    the options are split into blocks of ``COMPLETION_INDEX_BLOCK_SIZE``. The lowercase inserts of a block are joined to
+    one UTF-8 text, one insert per line, and each byte has a bit set of its positions in that text. The positions following
+    a match of the query's start within the same line are found with a single big integer subtraction, so matching a query
+    takes a few integer operations per byte and block. The match of each prefix of the last query is kept, so typing on
+    only matches the new bytes. Blocks are searched in the backend's order, only until enough options are found.
+
+    The bit sets of common identifier characters are built by ``warm`` on the inbound reader thread after the response
+    was handed over. Queries return the same options in the same order as ``rank_options`` for the whole list.
+    """
+
+    __slots__ = ('options', '_lowered', '_order', '_sorted', '_blocks')
+
+    def __init__(self, options):
+        #: Options as ``(insert, desc)``, in the backend's order.
+        self.options = options
+        self._lowered = lowered = [insert.lower() for insert, _ in options]
+        #: Indexes of the options, ordered by lowercase insert.
+        self._order = sorted(range(len(options)), key=lowered.__getitem__)
+        #: Lowercase inserts in ``_order``.
+        self._sorted = [lowered[index] for index in self._order]
+        lines = [text.replace('\n', ' ').encode('utf-8') for text in lowered]
+        self._blocks = [_Block(first, lines[first:first + COMPLETION_INDEX_BLOCK_SIZE])
+                        for first in range(0, len(lines), COMPLETION_INDEX_BLOCK_SIZE)]
+
+    @classmethod
+    def of(cls, response):
+        """Returns index of the options of given completion response, built on first use."""
+        index = getattr(response, 'index', None)
+        if index is None:
+            index = response.index = cls([(option.insert, option.desc) for option in response.options])
+        return index
+
+    @classmethod
+    def prepare(cls, response):
+        """Builds index of given completion response on the inbound reader thread, returns function warming it up."""
+        return cls.of(response).warm
+
+    def warm(self, chars=string.ascii_lowercase + string.digits + '_'):
+        """Builds the bit sets of given characters ahead of the first fuzzy query using them."""
+        for block in self._blocks:
+            for byte in chars.encode('utf-8'):
+                block.bits(byte)
+
+    def __len__(self):
+        return len(self.options)
+
+    def query(self, prefix, limit):
+        """Returns the at most ``limit`` options ``(insert, desc)`` best matching given prefix, best first."""
+        if not prefix:
+            return self.options[:limit]
+
+        lowered_prefix = prefix.lower()
+        start = bisect.bisect_left(self._sorted, lowered_prefix)
+        end = bisect.bisect_left(self._sorted, lowered_prefix + _MAX_CHAR, start)
+        indexes = self._order[start:min(end, start + limit)]
+        if len(indexes) < limit:
+            indexes.extend(self._fuzzy(lowered_prefix, limit - len(indexes)))
+        return [self.options[index] for index in indexes]
+
+    def _fuzzy(self, query, needed):
+        """Returns indexes of up to ``needed`` options containing the characters of ``query`` but not starting with it."""
+        encoded = query.encode('utf-8')
+        found = []
+        for block in self._blocks:
+            found.extend(block.search(query, encoded, self._lowered, needed - len(found)))
+            if len(found) == needed:
+                break
+        return found
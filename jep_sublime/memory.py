@@ -0,0 +1,116 @@
+"""Accounting of the memory held by the plugin's stores."""
+import sys
+
+#: Containers whose items are counted by ``approximate_size``.
+_CONTAINERS = (dict, list, tuple, set, frozenset)
+
+
+def approximate_size(obj, seen=None):
+    """Returns approximate number of bytes of given object and of the containers and strings it holds.
+
+    Other objects are counted without their attributes, so views or connections referenced by a store are not attributed to
+    it. Objects reachable more than once are counted once.
+    """
+    seen = set() if seen is None else seen
+    if id(obj) in seen:
+        return 0
+    seen.add(id(obj))
+
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approximate_size(key, seen) + approximate_size(value, seen) for key, value in obj.items())
+    elif isinstance(obj, _CONTAINERS) or type(obj).__name__ == 'deque':
+        size += sum(approximate_size(item, seen) for item in obj)
+    elif hasattr(obj, '__slots__') and not isinstance(obj, (str, bytes)):
+        size += sum(approximate_size(getattr(obj, name), seen) for name in obj.__slots__ if hasattr(obj, name))
+    return size
+
+
+def store_sizes(listener):
+    """Returns ``(store, entries, bytes)`` for each store of the plugin held by given event listener."""
+    from . import tracing
+    stores = []
+
+    def add(name, store, entries=None):
+        stores.append((name, len(store) if entries is None else entries, approximate_size(store)))
+
+    if listener.service_config_provider:
+        add('service configuration cache', listener.service_config_provider._entries)
+
+    manager = listener.backend_adapter
+    if manager:
+        registry = manager.registry
+        add('registry files', registry._file_entries)
+        add('registry views', registry._view_entries)
+        add('content tracker', manager.content_tracker.tracked_files | manager.content_tracker.modified_files)
+        scheduler = manager.sync_scheduler
+        add('sync scheduler', [scheduler._due, scheduler._first_pending_edit, scheduler._last_edit, scheduler._edit_interval],
+            len(scheduler._last_edit))
+        add('errors by file', manager.error_annotator.errors_by_file)
+        add('status bar', manager.status_bar._shown, sum(len(shown) for shown in manager.status_bar._shown.values()))
+        add('deferred view work', manager.work._work)
+        cached = manager.auto_completer.cached
+        add('cached completion options', [cached] if cached else [], len(cached.index) if cached else 0)
+        snapshots = manager.completion_snapshots
+        add('completion snapshots', snapshots._entries)
+        if manager._syntax_manager:
+            add('syntax hash cache', manager._syntax_manager.name_to_hash)
+        for con in registry.connections():
+            name = con.service_config.command
+            add('content shadow of %s' % name, con._content_shadow)
+            add('  of closed files', con._released, len(con._released))
+            add('outbound queue of %s' % name, [con._outbound, con._outbound_data], len(con._outbound))
+            add('metrics of %s' % name, [con.metrics.latency, con.metrics.sent, con.metrics.received], len(con.metrics.latency))
+        if manager.inbound_reader:
+            add('inbound message queue', manager.inbound_reader._inbound)
+
+    add('trace buffer', tracing._events)
+    if listener.recorder:
+        add('session recording', listener.recorder.events)
+    if listener.profiler:
+        add('profiling histograms', listener.profiler.histograms)
+    return stores
+
+
+def format_store_sizes(stores):
+    lines = ['%-60s %9s %12s' % ('store', 'entries', 'approx. KB')]
+    for name, entries, size in stores:
+        lines.append('%-60s %9d %12.1f' % (name, entries, size / 1024))
+    lines.append('%-60s %9s %12.1f' % ('total', '', sum(size for _, _, size in stores) / 1024))
+    return '\n'.join(lines)
+
+
+class TracemallocDiff:
+    """Compares heap snapshots taken by ``tracemalloc``, which is not available in every Python version Sublime ships."""
+
+    def __init__(self):
+        self._previous = None
+
+    @staticmethod
+    def is_available():
+        try:
+            import tracemalloc  # noqa: F401
+            return True
+        except ImportError:
+            return False
+
+    def snapshot(self, limit=25):
+        """Takes snapshot and returns the largest differences to the previous one, starts tracing on first call."""
+        import tracemalloc
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._previous = None
+
+        snapshot = tracemalloc.take_snapshot()
+        previous, self._previous = self._previous, snapshot
+        if previous is None:
+            return 'Tracing memory allocations from now on, take another snapshot to see the differences.'
+
+        lines = ['Largest differences to previous snapshot:']
+        lines.extend(str(statistic) for statistic in snapshot.compare_to(previous, 'lineno')[:limit])
+        return '\n'.join(lines)
+
+    def stop(self):
+        import tracemalloc
+        tracemalloc.stop()
+        self._previous = None
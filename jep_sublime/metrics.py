@@ -0,0 +1,90 @@
+"""Latency and traffic metrics of backend connections."""
+from jep_py.protocol import MessageSerializer
+from .profiling import Histogram, format_histograms
+
+
+def format_counters(title, counters):
+    """Returns single line of named counters, e.g. ``sync scheduler: edits 12, flushes 3, idle_seconds 4.2``."""
+    return '%s: %s' % (title, ', '.join('%s %s' % (name, '%.1f' % value if isinstance(value, float) else value)
+                                        for name, value in sorted(counters.items())) or 'none')
+
+
+class ConnectionMetrics:
+    """Request latencies, timeouts, traffic and outbound queue depths of a connection, by message type."""
+
+    def __init__(self):
+        #: Map from request message type to histogram of the time until its response.
+        self.latency = {}
+        #: Map from request message type to number of requests not answered in time.
+        self.timeouts = {}
+        #: Map from message type to ``[messages, bytes]`` sent.
+        self.sent = {}
+        #: Map from message type to ``[messages, bytes]`` received.
+        self.received = {}
+        #: Outbound queue depth, sampled whenever the queue is written.
+        self.queue_depth = {'samples': 0, 'total': 0, 'max': 0}
+
+    def on_sent(self, message_type, size):
+        traffic = self.sent.setdefault(message_type, [0, 0])
+        traffic[0] += 1
+        traffic[1] += size
+
+    def on_received(self, message_type, size):
+        traffic = self.received.setdefault(message_type, [0, 0])
+        traffic[0] += 1
+        traffic[1] += size
+
+    def on_response(self, message_type, seconds):
+        histogram = self.latency.get(message_type)
+        if histogram is None:
+            histogram = self.latency[message_type] = Histogram()
+        histogram.add(seconds)
+
+    def on_timeout(self, message_type):
+        self.timeouts[message_type] = self.timeouts.get(message_type, 0) + 1
+
+    def on_queue_depth(self, depth):
+        queue_depth = self.queue_depth
+        queue_depth['samples'] += 1
+        queue_depth['total'] += depth
+        if depth > queue_depth['max']:
+            queue_depth['max'] = depth
+
+    def format(self):
+        """Returns multi-line report of all metrics."""
+        lines = [format_histograms(self.latency, 'request latency')]
+        for message_type, timeouts in sorted(self.timeouts.items()):
+            lines.append('%-44s %8d' % (message_type + ' timeouts', timeouts))
+        lines.append('')
+        lines.append('%-44s %8s %10s %8s %10s' % ('traffic', 'sent', 'bytes', 'received', 'bytes'))
+        for message_type in sorted(set(self.sent) | set(self.received)):
+            sent = self.sent.get(message_type, (0, 0))
+            received = self.received.get(message_type, (0, 0))
+            lines.append('%-44s %8d %10d %8d %10d' % (message_type, sent[0], sent[1], received[0], received[1]))
+        queue_depth = self.queue_depth
+        lines.append('')
+        lines.append('outbound queue depth: mean %.1f, max %d' % (queue_depth['total'] / (queue_depth['samples'] or 1), queue_depth['max']))
+        return '\n'.join(lines)
+
+    def format_line(self):
+        """Returns single line summary, for periodic logging."""
+        latency = ', '.join('%s p50 %.0f ms p95 %.0f ms' % (message_type, 1000 * histogram.percentile(0.5), 1000 * histogram.percentile(0.95))
+                            for message_type, histogram in sorted(self.latency.items())) or 'no requests'
+        return '%s, %d timeouts, sent %d bytes, received %d bytes, max queue depth %d' % (
+            latency, sum(self.timeouts.values()), sum(traffic[1] for traffic in self.sent.values()),
+            sum(traffic[1] for traffic in self.received.values()), self.queue_depth['max'])
+
+
+class MeteredSerializer(MessageSerializer):
+    """Message serializer counting the bytes of each received message."""
+
+    def __init__(self, metrics, packer=None):
+        super().__init__(packer)
+        self.metrics = metrics
+
+    def dequeue_message(self):
+        buffered = len(self.buffer)
+        message = super().dequeue_message()
+        if message:
+            self.metrics.on_received(type(message).__name__, buffered - len(self.buffer))
+        return message
@@ -0,0 +1,152 @@
+"""Speculative completion requests sent when a trigger character is typed."""
+import datetime
+import fnmatch
+import os
+import re
+import time
+import sublime
+from jep_py.frontend import State
+from jep_py.schema import CompletionRequest
+from . import settings
+from .snapshot import CompletionSnapshotCache
+from .tracing import trace
+
+#: Text allowed between a trigger and the caret for a prefetch to stay valid, i.e. the word being completed.
+_WORD = re.compile(r'\w*$')
+
+
+class Prefetch:
+    """Completion request sent ahead of time for the word starting at ``pos``."""
+
+    __slots__ = ('filename', 'pos', 'trigger', 'context', 'token', 'sent_at')
+
+    def __init__(self, filename, pos, trigger, context, token):
+        self.filename = filename
+        self.pos = pos
+        self.trigger = trigger
+        #: Line text in front of ``pos``, see ``CompletionSnapshotCache.context``.
+        self.context = context
+        self.token = token
+        self.sent_at = time.monotonic()
+
+
+class CompletionPrefetcher:
+    """Requests completions as soon as a trigger character like ``.`` or ``::`` is typed.
+
+    The trigger characters are configured per file pattern by the ``completion_triggers`` setting, whose keys are either
+    patterns of a ``.jep`` file or patterns matched against the file name. Pending modifications are flushed first, then the
+    request is sent without waiting for the response, which usually arrives while Sublime is still opening the completion
+    popup. A prefetch is cancelled if the caret leaves the word following the trigger, and replaced by the next trigger.
+    There is no cancellation in the protocol, the response of a cancelled prefetch is dropped on arrival.
+    """
+
+    def __init__(self, backend_adapter):
+        self.backend_adapter = backend_adapter
+        #: Pending prefetch, ``None`` if there is none.
+        self.pending = None
+        #: Counters of prefetches sent, used with and without waiting, cancelled and replaced without being used.
+        self.stats = {'sent': 0, 'hits': 0, 'waited': 0, 'cancelled': 0, 'unused': 0}
+
+    def triggers(self, con, filename):
+        """Returns the trigger characters configured for given file served by given connection."""
+        configured = settings.get('completion_triggers')
+        if not configured:
+            return ()
+
+        basename = os.path.basename(filename)
+        patterns = con.service_config.patterns
+        triggers = []
+        for pattern, chars in configured.items():
+            if pattern in patterns or fnmatch.fnmatch(basename, pattern):
+                triggers.extend(chars)
+        return triggers
+
+    def on_modified(self, view, filename, con):
+        pending = self.pending
+        if pending and pending.filename == filename and not self._is_valid(view, pending):
+            self._cancel('cancelled')
+
+        triggers = self.triggers(con, filename)
+        if not triggers or con.state is not State.Connected:
+            return
+
+        sel = view.sel()
+        if len(sel) != 1 or not sel[0].empty():
+            return
+        pos = sel[0].b
+        text = view.substr(sublime.Region(max(0, pos - max(len(trigger) for trigger in triggers)), pos))
+        for trigger in triggers:
+            if text.endswith(trigger):
+                self._send(view, filename, con, pos, trigger)
+                break
+
+    def take(self, con, filename, start, context, duration):
+        """Returns ``(prefetched, response)`` for a completion of the word at given start, waiting for the response of a
+        prefetch sent for that word until given duration passed since it was sent.
+
+        ``prefetched`` tells whether there was such a prefetch, so a missing response need not be requested once more. Any
+        pending prefetch is done with afterwards.
+        """
+        pending = self.pending
+        if not pending:
+            return False, None
+
+        if pending.filename != filename or pending.pos != start or pending.context != context:
+            self._cancel('unused')
+            return False, None
+
+        self.pending = None
+
+        arrived = con.has_response(pending.token)
+        # the prefetch had its time while the word was typed, only wait for the rest of the usual timeout:
+        remaining = max(0.0, duration.total_seconds() - (time.monotonic() - pending.sent_at))
+        response = con.take_response(pending.token, datetime.timedelta(seconds=remaining))
+        if response is None:
+            self.stats['unused'] += 1
+            trace('Prefetched completions for %s at %d did not arrive in time.', filename, start)
+        else:
+            self.stats['hits' if arrived else 'waited'] += 1
+            trace('Using prefetched completions for %s at %d, sent %.1f ms ago.', filename, start, 1000 * (time.monotonic() - pending.sent_at))
+        return True, response
+
+    def forget(self, filename):
+        if self.pending and self.pending.filename == filename:
+            self._cancel('cancelled')
+
+    def report(self):
+        stats = self.stats
+        used = stats['hits'] + stats['waited']
+        return 'prefetches: %d sent, %d used (%d had arrived already, hit rate %.0f%%), %d cancelled, %d not used' % (
+            stats['sent'], used, stats['hits'], 100 * used / (stats['sent'] or 1), stats['cancelled'], stats['unused'])
+
+    def _send(self, view, filename, con, pos, trigger):
+        if self.pending:
+            self._cancel('unused')
+
+        # the backend has to see the trigger before it is asked:
+        self.backend_adapter.flush_content(view)
+        token = con.send_request(CompletionRequest(file=filename, pos=pos))
+        if token is not None:
+            self.pending = Prefetch(filename, pos, trigger, CompletionSnapshotCache.context(view, '', pos), token)
+            self.stats['sent'] += 1
+            trace('Prefetching completions for %s at %d after %r.', filename, pos, trigger)
+
+    def _is_valid(self, view, pending):
+        """Is the caret still in the word following the trigger the prefetch was sent for?"""
+        sel = view.sel()
+        if len(sel) != 1:
+            return False
+        pos = sel[0].b
+        return (pos >= pending.pos and view.substr(sublime.Region(pending.pos - len(pending.trigger), pending.pos)) == pending.trigger and
+                _WORD.match(view.substr(sublime.Region(pending.pos, pos))) is not None)
+
+    def _cancel(self, reason):
+        pending, self.pending = self.pending, None
+        con = self.backend_adapter.registry.connection_for_file(pending.filename)
+        self._forget(con, pending, reason)
+
+    def _forget(self, con, pending, reason):
+        self.stats[reason] += 1
+        if con:
+            con.forget_request(pending.token)
+        trace('Prefetch of completions for %s at %d %s.', pending.filename, pending.pos, reason)
@@ -0,0 +1,50 @@
+"""Start of backends ahead of the first request."""
+import collections
+import fnmatch
+import logging
+from jep_py.frontend import State
+from . import settings
+
+_logger = logging.getLogger(__name__)
+
+
+class Prewarmer:
+    """Starts the backends configured for the folders and files open in Sublime windows in the background.
+
+    Configurations are collected when the plugin is loaded or a project is opened. Backends are then started over the
+    following poll ticks, at most ``prewarm_max_concurrent_starts`` at a time. Configurations with a pattern listed in
+    ``prewarm_excluded_patterns`` are skipped and their backends are started on demand as before.
+    """
+
+    def __init__(self, connection_manager, service_config_provider):
+        self.connection_manager = connection_manager
+        self.service_config_provider = service_config_provider
+        #: Map from selector to service configuration whose backend still needs to be started.
+        self._pending = collections.OrderedDict()
+
+    @staticmethod
+    def is_excluded(config):
+        excluded = settings.get('prewarm_excluded_patterns')
+        return any(fnmatch.fnmatch(pattern, excluded_pattern) for pattern in config.patterns for excluded_pattern in excluded)
+
+    def scan(self, windows):
+        """Schedules start of backends for the folders and files open in given windows."""
+        for config in self.service_config_provider.provide_for_windows(windows):
+            if self.is_excluded(config):
+                _logger.debug('Backend for patterns %s excluded from pre-warming.' % ', '.join(sorted(config.patterns)))
+            else:
+                self._pending.setdefault(config.selector, config)
+        self.start_pending()
+
+    def start_pending(self):
+        """Starts pending backends as long as the limit of concurrently starting backends is not reached."""
+        if not self._pending:
+            return
+
+        starting = sum(1 for con in self.connection_manager.registry.connections() if con.state is State.Connecting)
+        while self._pending and starting < settings.get('prewarm_max_concurrent_starts'):
+            _, config = self._pending.popitem(last=False)
+            con = self.connection_manager.connect_service(config)
+            if con and con.state is State.Connecting:
+                _logger.info('Pre-warming backend %s.' % config.command)
+                starting += 1
@@ -0,0 +1,106 @@
+"""Prioritization of work by the focus of the views it is done for."""
+import collections
+import time
+import sublime
+from .constants import BACKGROUND_WORK_BUDGET_MS
+
+#: View has the input focus.
+FOREGROUND = 0
+#: View is shown in a group or window without input focus.
+VISIBLE = 1
+#: View is a tab in the background.
+HIDDEN = 2
+
+
+def view_ranks():
+    """Returns map from id of each view shown in any window to its priority, views not in the map are ``HIDDEN``."""
+    ranks = {}
+    for window in sublime.windows():
+        for group in range(window.num_groups()):
+            view = window.active_view_in_group(group)
+            if view:
+                ranks[view.id()] = VISIBLE
+
+    view_id = foreground_view_id()
+    if view_id is not None:
+        ranks[view_id] = FOREGROUND
+    return ranks
+
+
+def foreground_view_id():
+    """Returns id of the view having the input focus, ``None`` if there is none."""
+    window = sublime.active_window()
+    view = window.active_view() if window else None
+    return view.id() if view else None
+
+
+class WorkQueue:
+    """Queue of deferred work for views, run in the order of the views' focus.
+
+    Work is keyed, so work submitted again before it ran replaces the older one, e.g. rendering a file's problems twice.
+    Work for the foreground view is not queued but done right away, other work only as long as the tick's budget of
+    ``BACKGROUND_WORK_BUDGET_MS`` is not used up. The rest waits for the next tick or for its view to be activated, so
+    background tabs never delay the view being edited.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self.clock = clock
+        #: Map from key to ``(view id, callable)`` of work not done yet.
+        self._work = collections.OrderedDict()
+        #: Keys of queued work postponed at least once as the budget was used up.
+        self._postponed = set()
+        #: Counters of work done and postponed, each work counts as starved once however often it is postponed.
+        self.stats = {'submitted': 0, 'replaced': 0, 'foreground': 0, 'background': 0, 'starved': 0}
+
+    def __len__(self):
+        return len(self._work)
+
+    def submit(self, key, view_id, work):
+        """Submits callable doing work for view of given id, which is called right away if the view has the focus."""
+        if key in self._work:
+            self.stats['replaced'] += 1
+            del self._work[key]
+            self._postponed.discard(key)
+        self.stats['submitted'] += 1
+        if view_id == foreground_view_id():
+            self.stats['foreground'] += 1
+            work()
+        else:
+            self._work[key] = (view_id, work)
+
+    def discard_view(self, view_id):
+        """Drops all work for given view, e.g. as it was closed."""
+        for key in [key for key, (work_view_id, _) in self._work.items() if work_view_id == view_id]:
+            del self._work[key]
+            self._postponed.discard(key)
+
+    def run(self, ranks=None, started=None):
+        """Runs work in order of priority given by ``ranks`` (default: current focus) within the tick started at
+        ``started``.
+        """
+        if not self._work:
+            return
+
+        ranks = view_ranks() if ranks is None else ranks
+        started = self.clock() if started is None else started
+        budget = BACKGROUND_WORK_BUDGET_MS / 1000
+        for key, (view_id, work) in sorted(self._work.items(), key=lambda item: ranks.get(item[1][0], HIDDEN)):
+            if ranks.get(view_id, HIDDEN) == FOREGROUND:
+                self.stats['foreground'] += 1
+            elif self.clock() - started < budget:
+                self.stats['background'] += 1
+            else:
+                self.stats['starved'] += len(self._work.keys() - self._postponed)
+                self._postponed.update(self._work)
+                return
+            del self._work[key]
+            self._postponed.discard(key)
+            work()
+
+    def run_for_view(self, view_id):
+        """Runs all work for given view right away, e.g. as it was activated."""
+        for key in [key for key, (work_view_id, _) in self._work.items() if work_view_id == view_id]:
+            _, work = self._work.pop(key)
+            self._postponed.discard(key)
+            self.stats['foreground'] += 1
+            work()
@@ -0,0 +1,125 @@
+"""Optional instrumentation of the plugin's hot paths."""
+import functools
+import logging
+import math
+import time
+from .constants import HISTOGRAM_BUCKETS, HISTOGRAM_FACTOR, HISTOGRAM_MIN_S
+
+_logger = logging.getLogger(__name__)
+
+_LOG_FACTOR = math.log(HISTOGRAM_FACTOR)
+
+
+class Histogram:
+    """Distribution of durations in a fixed number of logarithmic buckets.
+
+    Bucket ``i`` counts durations up to ``HISTOGRAM_MIN_S * HISTOGRAM_FACTOR ** i``, so percentiles are accurate to the
+    factor between buckets, whatever the number of samples.
+    """
+
+    __slots__ = ('buckets', 'count', 'total', 'max')
+
+    def __init__(self):
+        self.buckets = [0] * HISTOGRAM_BUCKETS
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        self.count += 1
+        self.total += seconds
+        if seconds > self.max:
+            self.max = seconds
+        index = int(math.ceil(math.log(seconds / HISTOGRAM_MIN_S) / _LOG_FACTOR)) if seconds > HISTOGRAM_MIN_S else 0
+        self.buckets[min(index, HISTOGRAM_BUCKETS - 1)] += 1
+
+    def percentile(self, fraction):
+        """Returns upper bound of the duration below which given fraction of the samples lies."""
+        if not self.count:
+            return 0.0
+        rank = fraction * self.count
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= rank:
+                return min(HISTOGRAM_MIN_S * HISTOGRAM_FACTOR ** index, self.max)
+        return self.max
+
+
+def format_histograms(histograms, title='operation'):
+    """Returns table of given map from name to histogram, durations in milliseconds."""
+    lines = ['%-44s %8s %10s %8s %8s %8s %8s %8s' % (title, 'count', 'total ms', 'mean', 'p50', 'p95', 'p99', 'max')]
+    for name, histogram in sorted(histograms.items(), key=lambda item: -item[1].total):
+        if histogram.count:
+            lines.append('%-44s %8d %10.1f %8.3f %8.3f %8.3f %8.3f %8.3f' % (
+                name, histogram.count, 1000 * histogram.total, 1000 * histogram.total / histogram.count, 1000 * histogram.percentile(0.5),
+                1000 * histogram.percentile(0.95), 1000 * histogram.percentile(0.99), 1000 * histogram.max))
+    return '\n'.join(lines)
+
+
+class Profiler:
+    """Measures calls of methods by replacing them with timing wrappers on their instances.
+
+    Nothing is wrapped before ``enable``, and ``disable`` restores the original methods, so profiling costs nothing while it
+    is disabled.
+    """
+
+    def __init__(self):
+        #: Map from operation name to histogram of its durations.
+        self.histograms = {}
+        #: Wrapped methods as ``(instance, attribute name)``.
+        self._wrapped = []
+        self.enabled = False
+
+    def enable(self, listener):
+        """Instruments the event listener's callbacks and, if already created, its backend adapter."""
+        if self.enabled:
+            return
+        self.enabled = True
+        for name in dir(type(listener)):
+            if name.startswith('on_') and callable(getattr(listener, name)):
+                self.instrument(listener, name, 'listener.' + name)
+        if listener.backend_adapter:
+            self.instrument_backend_adapter(listener.backend_adapter)
+        _logger.info('Profiling enabled.')
+
+    def instrument_backend_adapter(self, backend_adapter):
+        if not self.enabled:
+            return
+        self.instrument(backend_adapter, 'run', 'ConnectionManager.run')
+        self.instrument(backend_adapter, 'synchronize_due_files', 'ConnectionManager.synchronize_due_files')
+        self.instrument(backend_adapter.content_tracker, 'synchronize_content', 'Tracker.synchronize_content')
+        self.instrument(backend_adapter.error_annotator, 'render', 'ErrorAnnotator.render')
+        self.instrument(backend_adapter.auto_completer, 'on_query_completions', 'Autocompleter.on_query_completions')
+
+    def disable(self):
+        """Restores all wrapped methods, keeping the numbers measured so far."""
+        for instance, name in self._wrapped:
+            # drop instance attribute to uncover the class' method again:
+            delattr(instance, name)
+        del self._wrapped[:]
+        self.enabled = False
+        _logger.info('Profiling disabled.')
+
+    def reset(self):
+        self.histograms.clear()
+
+    def instrument(self, instance, name, operation):
+        """Replaces method of given instance by a wrapper recording its durations as given operation."""
+        method = getattr(instance, name)
+        histogram = self.histograms.setdefault(operation, Histogram())
+        clock = time.perf_counter
+
+        @functools.wraps(method)
+        def timed(*args, **kwargs):
+            started = clock()
+            try:
+                return method(*args, **kwargs)
+            finally:
+                histogram.add(clock() - started)
+
+        setattr(instance, name, timed)
+        self._wrapped.append((instance, name))
+
+    def report(self):
+        return format_histograms(self.histograms)
@@ -0,0 +1,52 @@
+"""Ranking and formatting of completion options."""
+import heapq
+
+#: Match classes, better matches first.
+PREFIX_MATCH = 0
+FUZZY_MATCH = 1
+
+
+def is_subsequence(query, text):
+    """Do the characters of ``query`` appear in ``text`` in the same order?"""
+    position = 0
+    find = text.find
+    for char in query:
+        position = find(char, position) + 1
+        if not position:
+            return False
+    return True
+
+
+def match_key(insert, lowered_prefix, index):
+    """Returns sort key of option at given index of the response, ``None`` if it does not match the (lowercase) prefix.
+
+    Options starting with the prefix come first, alphabetically and case insensitive. Options containing the prefix's
+    characters in order follow, in the order of the backend.
+    """
+    lowered = insert.lower()
+    if lowered.startswith(lowered_prefix):
+        return PREFIX_MATCH, lowered, index
+    if is_subsequence(lowered_prefix, lowered):
+        return FUZZY_MATCH, '', index
+    return None
+
+
+def rank_options(options, prefix, limit):
+    """Returns the at most ``limit`` options ``(insert, desc)`` best matching given prefix, best first.
+
+    Only the best options are kept in a heap, the whole list is never sorted. Without prefix the backend's order is kept.
+    """
+    if not prefix:
+        return options[:limit]
+
+    lowered_prefix = prefix.lower()
+    keyed = ((match_key(option[0], lowered_prefix, index), option) for index, option in enumerate(options))
+    return [option for key, option in heapq.nsmallest(limit, (item for item in keyed if item[0] is not None), key=lambda item: item[0])]
+
+
+def format_option(insert, desc, max_length, suffix=''):
+    """Returns Sublime completion item of option, with its description truncated to ``max_length`` characters."""
+    desc = desc or ''
+    if len(desc) > max_length:
+        desc = desc[:max(0, max_length - 1)] + '…'
+    return ['%s\t%s%s' % (insert, desc, suffix), insert]
@@ -0,0 +1,59 @@
+"""Shutdown of backends that are no longer needed."""
+import logging
+import time
+from jep_py.frontend import State
+from . import settings
+
+_logger = logging.getLogger(__name__)
+
+
+class BackendReaper:
+    """Shuts down idle backends and limits the number of live backend processes.
+
+    A backend whose connection serves no view and was not used for ``backend_idle_timeout_s`` seconds is shut down. If more
+    than ``max_live_backends`` backends are alive, the least recently used ones are shut down, preferring those without
+    views. Backends serving a view shown in any window are never evicted, even if that keeps more backends alive than
+    allowed. A setting of 0 disables the respective limit.
+    """
+
+    def __init__(self, connection_manager, clock=time.monotonic):
+        self.connection_manager = connection_manager
+        self.clock = clock
+        #: Number of backends shut down per reason.
+        self.stats = {'idle': 0, 'evicted': 0}
+        #: Was it logged that shown views keep more backends alive than allowed? Logged once until the limit is kept.
+        self._over_limit_logged = False
+
+    def run(self, ranks):
+        """Shuts down backends no longer needed, given the map from id of each shown view to its priority."""
+        registry = self.connection_manager.registry
+        live = [con for con in registry.connections() if con.state is not State.Disconnected]
+
+        idle_timeout = settings.get('backend_idle_timeout_s')
+        if idle_timeout:
+            now = self.clock()
+            for con in list(live):
+                if not registry.num_views(con) and now - con.last_used > idle_timeout:
+                    _logger.info('Shutting down backend %s, idle for %d seconds.' % (con.service_config.command, now - con.last_used))
+                    self.stats['idle'] += 1
+                    self.connection_manager.retire_connection(con)
+                    live.remove(con)
+
+        max_live = settings.get('max_live_backends')
+        if not max_live or len(live) <= max_live:
+            self._over_limit_logged = False
+            return
+
+        # backends of views the user is looking at are kept:
+        evictable = [con for con in live if not any(view.id() in ranks for view in registry.views_for_connection(con))]
+        # least recently used first, connections without views before those still serving views:
+        evictable.sort(key=lambda con: (registry.num_views(con) > 0, con.last_used))
+        excess = len(live) - max_live
+        for con in evictable[:excess]:
+            _logger.info('Shutting down least recently used backend %s, more than %d backends alive.' % (con.service_config.command, max_live))
+            self.stats['evicted'] += 1
+            self.connection_manager.retire_connection(con)
+
+        if excess > len(evictable) and not self._over_limit_logged:
+            self._over_limit_logged = True
+            _logger.info('Keeping %d backends alive although at most %d are allowed, as they serve views shown.' % (len(live) - len(evictable), max_live))
@@ -0,0 +1,98 @@
+"""Recording of editing sessions, to be replayed by the benchmark harness."""
+import logging
+import time
+import zlib
+import umsgpack
+import sublime
+from jep_py.frontend import BackendListener
+from .constants import RECORDING_FORMAT_VERSION
+from .content import content_delta
+
+_logger = logging.getLogger(__name__)
+
+#: First event of a view: file name, content and path of the ``.jep`` file of its backend.
+OPEN = 'open'
+LOAD = 'load'
+ACTIVATED = 'activated'
+MODIFIED = 'modified'
+SELECTION = 'selection'
+COMPLETIONS = 'completions'
+SAVE = 'save'
+CLOSE = 'close'
+#: Message received from a backend, with message type and file.
+BACKEND = 'backend'
+
+
+class SessionRecorder(BackendListener):
+    """Records the Sublime callbacks of views handled by JEP and the messages received from backends.
+
+    Each event is a list ``[milliseconds since start, kind, view id, arguments...]``. The first event of a view carries its
+    whole content, modifications only the changed range ``start, end, data``. Completion events also carry the duration of
+    the request in milliseconds. The recording is kept in memory and written compressed by ``save``.
+    """
+
+    def __init__(self, path, clock=time.monotonic):
+        self.path = path
+        self.clock = clock
+        self.started = clock()
+        self.started_wall = time.time()
+        self.events = []
+        #: Map from view id to content last recorded.
+        self._contents = {}
+
+    def _time_ms(self):
+        return int((self.clock() - self.started) * 1000)
+
+    def on_view_event(self, kind, view, *args, config_file_path=None):
+        """Records callback of given kind for view, preceded by the view's content if it was not seen before."""
+        view_id = view.id()
+        if view_id not in self._contents:
+            content = view.substr(sublime.Region(0, view.size()))
+            self._contents[view_id] = content
+            self.events.append([self._time_ms(), OPEN, view_id, view.file_name(), content, config_file_path])
+
+        if kind == MODIFIED:
+            content = view.substr(sublime.Region(0, view.size()))
+            delta = content_delta(self._contents[view_id], content)
+            if not delta:
+                return
+            self._contents[view_id] = content
+            args = delta
+        elif kind == CLOSE:
+            self._contents.pop(view_id, None)
+
+        self.events.append([self._time_ms(), kind, view_id] + list(args))
+
+    def _on_backend_message(self, message):
+        self.events.append([self._time_ms(), BACKEND, None, type(message).__name__, getattr(message, 'file', None)])
+
+    def on_out_of_sync(self, out_of_sync, context):
+        self._on_backend_message(out_of_sync)
+
+    def on_content_sync(self, content_sync, context):
+        self._on_backend_message(content_sync)
+
+    def on_problem_update(self, problem_update, context):
+        self._on_backend_message(problem_update)
+
+    def on_completion_response(self, completion_response, context):
+        self._on_backend_message(completion_response)
+
+    def on_static_syntax_list(self, format_, syntaxes, context):
+        self.events.append([self._time_ms(), BACKEND, None, 'StaticSyntaxList', None])
+
+    def save(self):
+        """Writes recording to its file."""
+        data = {'version': RECORDING_FORMAT_VERSION, 'started': self.started_wall, 'events': self.events}
+        with open(self.path, 'wb') as f:
+            f.write(zlib.compress(umsgpack.packb(data)))
+        _logger.info('Recorded %d events to %s.' % (len(self.events), self.path))
+
+
+def load_recording(path):
+    """Returns the recording stored in given file as dictionary with keys ``version``, ``started`` and ``events``."""
+    with open(path, 'rb') as f:
+        data = umsgpack.unpackb(zlib.decompress(f.read()))
+    if data['version'] != RECORDING_FORMAT_VERSION:
+        raise ValueError('Unsupported recording format version %s.' % data['version'])
+    return data
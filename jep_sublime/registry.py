@@ -0,0 +1,133 @@
+"""Registry of views and files served by JEP connections."""
+
+
+class FileEntry:
+    """Registration of a file with the connection serving it and the ids of all views showing it."""
+
+    __slots__ = ('filename', 'connection', 'view_ids')
+
+    def __init__(self, filename, connection):
+        self.filename = filename
+        self.connection = connection
+        #: Ids of views showing the file, the file stays registered as long as this set is not empty.
+        self.view_ids = set()
+
+
+class ConnectionRegistry:
+    """Associates Sublime views and files with JEP connections.
+
+    Views are keyed by id and files by name. A file entry is reference counted by the views showing it, so clones and split
+    panes of a file share a single entry and therefore a single content synchronization stream. Attaching and detaching
+    views as well as all lookups are constant time operations.
+    """
+
+    def __init__(self):
+        #: Map from view id to attached view.
+        self.views = {}
+        #: Map from view id to file entry of the view.
+        self._view_entries = {}
+        #: Map from file name to file entry.
+        self._file_entries = {}
+        #: Map from connection to map of file name to file entry.
+        self._connection_entries = {}
+        #: Map from connection to ids of the views it serves.
+        self._connection_view_ids = {}
+
+    def add_connection(self, connection):
+        """Registers connection, even if it does not serve any view yet."""
+        self._connection_entries.setdefault(connection, {})
+        self._connection_view_ids.setdefault(connection, set())
+
+    def remove_connection(self, connection):
+        """Removes connection and all views and files it serves."""
+        for view_id in list(self._connection_view_ids.get(connection, ())):
+            self.detach(view_id)
+        self._connection_entries.pop(connection, None)
+        self._connection_view_ids.pop(connection, None)
+
+    def stale_view_ids(self, view_id, filename, connection):
+        """Returns ids of the views to be detached before the view of given id can be attached to given file and connection.
+
+        These are the view itself if it showed another file, e.g. before "save as", and all views of the file if the file
+        is served by another connection, e.g. due to a changed configuration.
+        """
+        stale = set()
+        entry = self._view_entries.get(view_id)
+        if entry and (entry.filename != filename or entry.connection is not connection):
+            stale.add(view_id)
+        entry = self._file_entries.get(filename)
+        if entry and entry.connection is not connection:
+            stale.update(entry.view_ids)
+        return stale
+
+    def attach(self, view, filename, connection):
+        """Attaches view showing given file to connection and returns the file entry.
+
+        Raises ``ValueError`` if views returned by ``stale_view_ids`` are still attached.
+        """
+        view_id = view.id()
+        if self.stale_view_ids(view_id, filename, connection):
+            raise ValueError('View %s or file %s is still attached to another file or connection.' % (view_id, filename))
+
+        entry = self._file_entries.get(filename)
+        if not entry:
+            entry = FileEntry(filename, connection)
+            self._file_entries[filename] = entry
+            self.add_connection(connection)
+            self._connection_entries[connection][filename] = entry
+
+        entry.view_ids.add(view_id)
+        self.views[view_id] = view
+        self._view_entries[view_id] = entry
+        self._connection_view_ids[connection].add(view_id)
+        return entry
+
+    def detach(self, view_id):
+        """Detaches view and returns its former file entry or ``None``. The entry's ``view_ids`` holds the views left."""
+        entry = self._view_entries.pop(view_id, None)
+        self.views.pop(view_id, None)
+        if entry:
+            entry.view_ids.discard(view_id)
+            self._connection_view_ids[entry.connection].discard(view_id)
+            if not entry.view_ids:
+                self._file_entries.pop(entry.filename, None)
+                self._connection_entries[entry.connection].pop(entry.filename, None)
+        return entry
+
+    def is_attached(self, view_id):
+        return view_id in self.views
+
+    def entry_for_view(self, view_id):
+        return self._view_entries.get(view_id)
+
+    def entry_for_file(self, filename):
+        return self._file_entries.get(filename)
+
+    def connection_for_view(self, view_id):
+        entry = self._view_entries.get(view_id)
+        return entry.connection if entry else None
+
+    def connection_for_file(self, filename):
+        entry = self._file_entries.get(filename)
+        return entry.connection if entry else None
+
+    def connections(self):
+        """Returns list of all registered connections."""
+        return list(self._connection_entries)
+
+    def entries_for_connection(self, connection):
+        """Returns file entries of all files served by connection."""
+        return list(self._connection_entries.get(connection, {}).values())
+
+    def views_for_connection(self, connection):
+        """Returns all views served by connection."""
+        views = self.views
+        return [views[view_id] for view_id in self._connection_view_ids.get(connection, ())]
+
+    def views_for_file(self, filename):
+        entry = self._file_entries.get(filename)
+        views = self.views
+        return [views[view_id] for view_id in entry.view_ids] if entry else []
+
+    def num_views(self, connection):
+        return len(self._connection_view_ids.get(connection, ()))
@@ -0,0 +1,132 @@
+"""Resolution of edited files to JEP service configurations."""
+import collections
+import logging
+import os
+import time
+from os.path import abspath, basename, dirname, join
+from jep_py.config import ServiceConfigProvider
+from .constants import SERVICE_CONFIG_CACHE_SIZE, SERVICE_CONFIG_FILE_NAME, SERVICE_CONFIG_NEGATIVE_TTL_S
+
+_logger = logging.getLogger(__name__)
+
+#: Parsed configuration file: modification time, checksum and service configurations, valid until expiry (monotonic time).
+ConfigFileEntry = collections.namedtuple('ConfigFileEntry', 'mtime checksum configs expires')
+
+
+class CachingServiceConfigProvider(ServiceConfigProvider):
+    """Service configuration provider caching parsed configuration files per directory.
+
+    Directories without configuration file are cached as negative entries, so switching between files without backend does
+    no file system work. Negative entries expire after ``SERVICE_CONFIG_NEGATIVE_TTL_S`` seconds to pick up configuration
+    files created outside the editor. Positive entries are validated by the configuration file's modification time. Saving
+    a configuration file in the editor invalidates its entry immediately.
+    """
+
+    def __init__(self, config_file_name=SERVICE_CONFIG_FILE_NAME, cache_size=SERVICE_CONFIG_CACHE_SIZE):
+        self.config_file_name = config_file_name
+        self.cache_size = cache_size
+        #: Map from configuration file path to its parsed entry, in least recently used order.
+        self._entries = collections.OrderedDict()
+        #: Number of lookups and of lookups that needed to access the file system.
+        self.stats = {'lookups': 0, 'filesystem': 0}
+
+    def provide_for(self, edited_file_name, config_file_name=None):
+        """Returns service configuration for given file name that is going to be edited."""
+        self.stats['lookups'] += 1
+        config_file_name = config_file_name or self.config_file_name
+        search_patterns = {self._file_pattern(edited_file_name), basename(edited_file_name)}
+        now = time.monotonic()
+
+        lastdir = None
+        curdir = dirname(abspath(edited_file_name))
+        while curdir != lastdir:
+            for config in self._entry(join(curdir, config_file_name), now).configs:
+                if not search_patterns.isdisjoint(config.patterns):
+                    return config
+            lastdir = curdir
+            curdir = dirname(curdir)
+
+        # not found:
+        return None
+
+    def provide_for_directory(self, dirpath, config_file_name=None):
+        """Returns all service configurations of the configuration file closest to given directory."""
+        config_file_name = config_file_name or self.config_file_name
+        now = time.monotonic()
+
+        lastdir = None
+        curdir = abspath(dirpath)
+        while curdir != lastdir:
+            configs = self._entry(join(curdir, config_file_name), now).configs
+            if configs:
+                return configs
+            lastdir = curdir
+            curdir = dirname(curdir)
+
+        # not found:
+        return ()
+
+    def provide_for_windows(self, windows):
+        """Returns service configurations of the files and folders open in given Sublime windows, in order of appearance."""
+        configs = collections.OrderedDict()
+        for window in windows:
+            for view in window.views():
+                filename = view.file_name()
+                config = filename and self.provide_for(filename)
+                if config:
+                    configs.setdefault(config.selector, config)
+            for folder in window.folders():
+                for config in self.provide_for_directory(folder):
+                    configs.setdefault(config.selector, config)
+        return list(configs.values())
+
+    def checksum(self, config_file_path):
+        """Returns checksum of given configuration file, re-reading it only if it was modified."""
+        return self._entry(abspath(config_file_path), time.monotonic()).checksum
+
+    def invalidate(self, config_file_path):
+        """Drops cached entry of given configuration file, e.g. because it was saved in the editor."""
+        _logger.debug('Invalidating cached service configuration %s.' % config_file_path)
+        self._entries.pop(abspath(config_file_path), None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _entry(self, config_file_path, now):
+        entry = self._entries.get(config_file_path)
+        if entry and entry.mtime is None and now < entry.expires:
+            # directory known to hold no configuration file:
+            self._entries.move_to_end(config_file_path)
+            return entry
+
+        self.stats['filesystem'] += 1
+        try:
+            mtime = os.stat(config_file_path).st_mtime
+        except OSError:
+            mtime = None
+
+        if entry and mtime is not None and mtime == entry.mtime:
+            self._entries.move_to_end(config_file_path)
+            return entry
+
+        if mtime is None:
+            entry = ConfigFileEntry(None, None, (), now + SERVICE_CONFIG_NEGATIVE_TTL_S)
+        else:
+            entry = self._parse(config_file_path, mtime)
+
+        self._entries[config_file_path] = entry
+        self._entries.move_to_end(config_file_path)
+        while len(self._entries) > self.cache_size:
+            self._entries.popitem(last=False)
+        return entry
+
+    def _parse(self, config_file_path, mtime):
+        _logger.debug('Parsing service configuration %s.' % config_file_path)
+        try:
+            configs = tuple(self._configurations(config_file_path))
+        except OSError as e:
+            _logger.warning('Cannot read service configuration %s: %s' % (config_file_path, e))
+            return ConfigFileEntry(None, None, (), time.monotonic() + SERVICE_CONFIG_NEGATIVE_TTL_S)
+
+        checksum = configs[0].checksum if configs else super().checksum(config_file_path)
+        return ConfigFileEntry(mtime, checksum, configs, None)
@@ -0,0 +1,130 @@
+"""Scheduling of content synchronization and connection polling."""
+import time
+from .constants import FRONTEND_IDLE_POLL_PERIOD_MS, FRONTEND_POLL_PERIOD_MS, SYNC_BACKPRESSURE_DELAY_MS, SYNC_DEBOUNCE_FACTOR, \
+    SYNC_DEBOUNCE_MAX_MS, SYNC_DEBOUNCE_MIN_MS, SYNC_EDIT_INTERVAL_SMOOTHING, SYNC_MAX_DELAY_MS
+
+
+class SyncScheduler:
+    """Decides when modified files are synchronized with the backend and how often connections are polled.
+
+    Edits are debounced per file: the synchronization is delayed by a multiple of the smoothed interval between the file's
+    edits, bounded by ``SYNC_DEBOUNCE_MIN_MS`` and ``SYNC_DEBOUNCE_MAX_MS``. Fast typing is thereby coalesced into few
+    syncs while an isolated edit is sent almost immediately. A file is never delayed by more than ``SYNC_MAX_DELAY_MS``
+    after its first pending edit. Requests depending on the file content flush it right away. While the backend does not
+    read fast enough, syncs are deferred by ``SYNC_BACKPRESSURE_DELAY_MS``.
+
+    Without pending syncs the scheduler does not arm any timer and the connection poll period backs off from
+    ``FRONTEND_POLL_PERIOD_MS`` to ``FRONTEND_IDLE_POLL_PERIOD_MS``.
+    """
+
+    def __init__(self, clock=time.monotonic):
+        self.clock = clock
+        #: Map from file name to smoothed interval between edits in seconds.
+        self._edit_interval = {}
+        #: Map from file name to time of its last edit.
+        self._last_edit = {}
+        #: Map from file name to time of its first edit not synchronized yet.
+        self._first_pending_edit = {}
+        #: Map from file name to time its synchronization is due.
+        self._due = {}
+        #: Current poll period, backing off while nothing happens.
+        self.poll_period_ms = FRONTEND_POLL_PERIOD_MS
+        #: Start of current period without pending syncs.
+        self._idle_since = self.clock()
+        #: Decisions taken so far.
+        self.stats = {'edits': 0, 'coalesced': 0, 'syncs': 0, 'flushes': 0, 'deferred': 0, 'starved': 0, 'idle_seconds': 0.0}
+
+    def on_edit(self, filename):
+        """Registers an edit of the given file and (re-)schedules its synchronization."""
+        now = self.clock()
+        self.stats['edits'] += 1
+        self._end_idle(now)
+        self.poll_period_ms = FRONTEND_POLL_PERIOD_MS
+
+        last = self._last_edit.get(filename)
+        if last is not None:
+            interval = min(now - last, SYNC_MAX_DELAY_MS / 1000)
+            smoothed = self._edit_interval.get(filename, interval)
+            self._edit_interval[filename] = smoothed + SYNC_EDIT_INTERVAL_SMOOTHING * (interval - smoothed)
+        self._last_edit[filename] = now
+
+        if filename in self._due:
+            self.stats['coalesced'] += 1
+        first = self._first_pending_edit.setdefault(filename, now)
+        self._due[filename] = min(now + self.debounce(filename), first + SYNC_MAX_DELAY_MS / 1000)
+
+    def schedule_now(self, filename):
+        """Schedules synchronization of given file without delay, e.g. for its initial content."""
+        now = self.clock()
+        self._end_idle(now)
+        self._first_pending_edit.setdefault(filename, now)
+        self._due[filename] = now
+
+    def defer(self, filename):
+        """Postpones due synchronization of given file, as its backend is backlogged."""
+        self.stats['deferred'] += 1
+        self._due[filename] = self.clock() + SYNC_BACKPRESSURE_DELAY_MS / 1000
+
+    def debounce(self, filename):
+        """Returns the current debounce delay of given file in seconds."""
+        interval = self._edit_interval.get(filename)
+        if interval is None:
+            return SYNC_DEBOUNCE_MIN_MS / 1000
+        return min(max(interval * SYNC_DEBOUNCE_FACTOR, SYNC_DEBOUNCE_MIN_MS / 1000), SYNC_DEBOUNCE_MAX_MS / 1000)
+
+    def due_files(self):
+        """Returns names of files whose synchronization is due."""
+        now = self.clock()
+        return [filename for filename, due in self._due.items() if due <= now]
+
+    def is_pending(self, filename):
+        return filename in self._due
+
+    def on_synchronized(self, filename, flushed=False):
+        """Registers synchronization of given file, ``flushed`` if forced ahead of schedule by a request."""
+        if self._due.pop(filename, None) is not None:
+            self.stats['flushes' if flushed else 'syncs'] += 1
+        self._first_pending_edit.pop(filename, None)
+        if not self._due and self._idle_since is None:
+            self._idle_since = self.clock()
+
+    def forget(self, filename):
+        """Drops all state of a file that is no longer tracked."""
+        self._due.pop(filename, None)
+        self._first_pending_edit.pop(filename, None)
+        self._last_edit.pop(filename, None)
+        self._edit_interval.pop(filename, None)
+        if not self._due and self._idle_since is None:
+            self._idle_since = self.clock()
+
+    def next_sync_delay_ms(self):
+        """Returns milliseconds until the next synchronization is due or ``None`` if no timer is needed.
+
+        Files already overdue (e.g. because their backend is not connected yet) are left to the regular poll.
+        """
+        now = self.clock()
+        upcoming = [due for due in self._due.values() if due > now]
+        if not upcoming:
+            return None
+        return max(1, int((min(upcoming) - now) * 1000))
+
+    def next_poll_period_ms(self, active):
+        """Returns the delay until the next connection poll, backing off while nothing is ``active``."""
+        if active or self._due:
+            self.poll_period_ms = FRONTEND_POLL_PERIOD_MS
+        else:
+            self.poll_period_ms = min(self.poll_period_ms * 2, FRONTEND_IDLE_POLL_PERIOD_MS)
+        return self.poll_period_ms
+
+    @property
+    def idle_seconds(self):
+        """Total time without pending synchronization."""
+        idle = self.stats['idle_seconds']
+        if self._idle_since is not None:
+            idle += self.clock() - self._idle_since
+        return idle
+
+    def _end_idle(self, now):
+        if self._idle_since is not None:
+            self.stats['idle_seconds'] += now - self._idle_since
+            self._idle_since = None
@@ -0,0 +1,30 @@
+"""User settings of the JEP plugin."""
+import sublime
+
+SETTINGS_FILE_NAME = 'JEP.sublime-settings'
+
+#: Values of settings missing in the settings file.
+DEFAULTS = {
+    'prewarm': True,
+    'prewarm_excluded_patterns': [],
+    'prewarm_max_concurrent_starts': 2,
+    'backend_idle_timeout_s': 900,
+    'max_live_backends': 6,
+    'completion_snapshots': True,
+    'completion_snapshot_max_age_days': 14,
+    'completion_snapshot_max_bytes': 4000000,
+    'profiling': False,
+    'metrics_log_period_s': 0,
+    'trace_buffer_size': 2000,
+    'max_error_files': 500,
+    'max_closed_file_shadows': 20,
+    'decode_on_worker_thread': True,
+    'completion_max_results': 200,
+    'completion_description_max_length': 60,
+    'completion_triggers': {},
+}
+
+
+def get(name):
+    """Returns value of setting with given name, falling back to its default."""
+    return sublime.load_settings(SETTINGS_FILE_NAME).get(name, DEFAULTS[name])
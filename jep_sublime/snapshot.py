@@ -0,0 +1,172 @@
+"""Persistent snapshots of completion responses."""
+import collections
+import functools
+import logging
+import os
+import time
+import zlib
+import umsgpack
+import sublime
+from . import settings
+from .constants import SNAPSHOT_CONTEXT_LENGTH, SNAPSHOT_FILE_NAME, SNAPSHOT_FORMAT_VERSION, SNAPSHOT_SAVE_PERIOD_S
+
+_logger = logging.getLogger(__name__)
+
+
+class CompletionSnapshotCache:
+    """Remembers the last completion options received for a file and context, across Sublime sessions.
+
+    The context of a completion is the text of the line in front of the word being completed, so the snapshot still applies
+    after the lines above were edited. Snapshots answer completion requests while the file's backend is starting or
+    restarting. They are stored compressed in Sublime's cache directory and saved at most every ``SNAPSHOT_SAVE_PERIOD_S``
+    seconds. Reading, decoding, encoding and writing the file happens on Sublime's async thread, only the handover of the
+    entries runs on the main thread. Until the file is loaded, lookups are answered from the snapshots stored in this
+    session. Snapshots older than ``completion_snapshot_max_age_days`` are dropped, and the least
+    recently stored ones are evicted once the total size exceeds ``completion_snapshot_max_bytes``.
+    """
+
+    def __init__(self, path=None, clock=time.time):
+        self.path = path
+        self.clock = clock
+        #: Map from ``(filename, context)`` to ``(timestamp, options)``, least recently stored first.
+        self._entries = collections.OrderedDict()
+        #: Were the snapshots of earlier sessions loaded? Nothing is saved before, not to overwrite them.
+        self._loaded = False
+        #: Approximate size of all entries in characters.
+        self.size = 0
+        #: Are there entries not saved yet?
+        self._dirty = False
+        #: Time of last save.
+        self._saved_at = clock()
+        #: Counters of snapshot use.
+        self.stats = {'hits': 0, 'misses': 0, 'stores': 0, 'evicted': 0}
+        sublime.set_timeout_async(self._load, 0)
+
+    @staticmethod
+    def context(view, prefix, pos):
+        """Returns the completion context at given position, i.e. the line text in front of the word ``prefix``."""
+        text = view.substr(sublime.Region(view.line(pos).begin(), pos))
+        if prefix and text.endswith(prefix):
+            text = text[:-len(prefix)]
+        return text[-SNAPSHOT_CONTEXT_LENGTH:].lstrip()
+
+    def lookup(self, filename, context):
+        """Returns the options ``(insert, desc)`` last stored for file and context, or ``None``."""
+        entry = self._entries.get((filename, context))
+        if entry is None or self._is_expired(entry[0]):
+            self.stats['misses'] += 1
+            return None
+        self.stats['hits'] += 1
+        return entry[1]
+
+    def store(self, filename, context, options):
+        """Stores options ``(insert, desc)`` received from the backend for file and context."""
+        entries = self._entries
+        key = (filename, context)
+        old = entries.pop(key, None)
+        if old is not None:
+            self.size -= self._entry_size(key, old[1])
+        entries[key] = (self.clock(), options)
+        self.size += self._entry_size(key, options)
+        self.stats['stores'] += 1
+        self._dirty = True
+        self._evict()
+
+    def save_if_due(self):
+        """Saves the snapshots if they were modified and the last save is long enough ago."""
+        if self._dirty and self.clock() - self._saved_at >= SNAPSHOT_SAVE_PERIOD_S:
+            self.save()
+
+    def save(self, blocking=False):
+        """Saves the snapshots on the async thread, or right away if ``blocking``, e.g. when the plugin is unloaded."""
+        if self._dirty and blocking and not self._loaded:
+            # the snapshots of this session are merged into those of earlier sessions, which are not loaded yet:
+            self._on_loaded(*self._read())
+        if not self._dirty or not self._loaded:
+            return
+
+        self._evict()
+        # options are never modified once stored, so the rows can be encoded on another thread:
+        rows = [[filename, context, timestamp, options] for (filename, context), (timestamp, options) in self._entries.items()]
+        self._dirty = False
+        self._saved_at = self.clock()
+        if blocking:
+            self._write(rows)
+        else:
+            sublime.set_timeout_async(functools.partial(self._write, rows), 0)
+
+    def _write(self, rows):
+        path = self._get_path()
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path + '.tmp', 'wb') as f:
+                f.write(zlib.compress(umsgpack.packb([SNAPSHOT_FORMAT_VERSION, rows])))
+            os.replace(path + '.tmp', path)
+            _logger.debug('Saved %d completion snapshots to %s.' % (len(rows), path))
+        except OSError as e:
+            _logger.warning('Could not save completion snapshots to %s: %s' % (path, e))
+            # try again with the next save:
+            self._dirty = True
+
+    def _get_path(self):
+        if not self.path:
+            self.path = os.path.join(sublime.cache_path(), 'JEP', SNAPSHOT_FILE_NAME)
+        return self.path
+
+    def _load(self):
+        """Reads the snapshots of earlier sessions on the async thread and hands them over to the main thread."""
+        sublime.set_timeout(functools.partial(self._on_loaded, *self._read()), 0)
+
+    def _read(self):
+        """Returns the snapshots of earlier sessions and their size."""
+        entries = collections.OrderedDict()
+        path = self._get_path()
+        try:
+            if os.path.exists(path):
+                with open(path, 'rb') as f:
+                    version, rows = umsgpack.unpackb(zlib.decompress(f.read()))
+                if version == SNAPSHOT_FORMAT_VERSION:
+                    for filename, context, timestamp, options in sorted(rows, key=lambda row: row[2]):
+                        entries[(filename, context)] = (timestamp, [tuple(option) for option in options])
+                else:
+                    _logger.info('Ignoring completion snapshots of format version %s.' % version)
+        except Exception as e:
+            _logger.warning('Ignoring unreadable completion snapshots in %s: %s' % (path, e))
+        size = sum(self._entry_size(key, options) for key, (timestamp, options) in entries.items())
+        return entries, size
+
+    def _on_loaded(self, entries, size):
+        if self._loaded:
+            # loaded by a blocking save in the meantime:
+            return
+        # snapshots stored in this session are more recent than the loaded ones:
+        for key, entry in self._entries.items():
+            old = entries.pop(key, None)
+            if old is not None:
+                size -= self._entry_size(key, old[1])
+            entries[key] = entry
+        self._entries = entries
+        self.size += size
+        self._loaded = True
+        self._evict()
+        _logger.debug('Loaded completion snapshots from %s, %d in total.' % (self._get_path(), len(entries)))
+
+    def _evict(self):
+        """Drops expired snapshots and the least recently stored ones above the size limit."""
+        entries = self._entries
+        max_size = settings.get('completion_snapshot_max_bytes')
+        while entries:
+            key, (timestamp, options) = next(iter(entries.items()))
+            if not self._is_expired(timestamp) and self.size <= max_size:
+                break
+            del entries[key]
+            self.size -= self._entry_size(key, options)
+            self.stats['evicted'] += 1
+            self._dirty = True
+
+    def _is_expired(self, timestamp):
+        return self.clock() - timestamp > settings.get('completion_snapshot_max_age_days') * 86400
+
+    @staticmethod
+    def _entry_size(key, options):
+        return len(key[0]) + len(key[1]) + sum(len(insert) + len(desc or '') for insert, desc in options)
@@ -0,0 +1,73 @@
+"""Status bar output."""
+
+
+class StatusBar:
+    """Sets status texts of views, calling Sublime only if a text actually changes.
+
+    The text last set is cached per view and key. Texts for views hidden in a background tab are kept until the view is
+    activated, so only the last of several updates reaches Sublime.
+    """
+
+    def __init__(self):
+        #: Map from view id to map from key to text last passed to Sublime.
+        self._shown = {}
+        #: Map from view id to map from key to text waiting for the view to be activated.
+        self._pending = {}
+        #: Counters of status updates requested, passed to Sublime and saved.
+        self.stats = {'requested': 0, 'applied': 0, 'unchanged': 0, 'coalesced': 0}
+
+    def set_status(self, view, key, text):
+        self.stats['requested'] += 1
+        view_id = view.id()
+        pending = self._pending.get(view_id)
+        if self._shown.get(view_id, {}).get(key) == text and not (pending and key in pending):
+            # cheapest case first, the window need not be asked:
+            self.stats['unchanged'] += 1
+            return
+
+        if not self.is_visible(view):
+            pending = self._pending.setdefault(view_id, {})
+            if key in pending:
+                self.stats['coalesced'] += 1
+            pending[key] = text
+            return
+
+        self._pending.get(view_id, {}).pop(key, None)
+        self._apply(view, key, text)
+
+    def erase_status(self, view, key):
+        view_id = view.id()
+        self._pending.get(view_id, {}).pop(key, None)
+        if self._shown.get(view_id, {}).pop(key, None) is not None:
+            view.erase_status(key)
+
+    def on_activated(self, view):
+        """Shows texts set while the view was hidden."""
+        pending = self._pending.pop(view.id(), None)
+        if pending:
+            for key, text in pending.items():
+                self._apply(view, key, text)
+
+    def forget_view(self, view_id):
+        """Drops cached texts of a closed view."""
+        self._pending.pop(view_id, None)
+        self._shown.pop(view_id, None)
+
+    @staticmethod
+    def is_visible(view):
+        """Is the view shown in its window, i.e. not a tab in the background?"""
+        window = view.window()
+        if not window:
+            return False
+        group, _ = window.get_view_index(view)
+        active = window.active_view_in_group(group)
+        return active is not None and active.id() == view.id()
+
+    def _apply(self, view, key, text):
+        shown = self._shown.setdefault(view.id(), {})
+        if shown.get(key) == text:
+            self.stats['unchanged'] += 1
+            return
+        shown[key] = text
+        view.set_status(key, text)
+        self.stats['applied'] += 1
@@ -0,0 +1,112 @@
+"""Supervised restart of crashed backends."""
+import logging
+import time
+from jep_py.frontend import State
+from .constants import RESTART_BACKOFF_MAX_MS, RESTART_BACKOFF_MIN_MS, RESTART_STABLE_MS
+
+_logger = logging.getLogger(__name__)
+
+
+class Restart:
+    """Restart state of a crashed backend."""
+
+    __slots__ = ('crashed_at', 'attempts', 'due', 'connected_at')
+
+    def __init__(self, crashed_at):
+        self.crashed_at = crashed_at
+        self.attempts = 0
+        self.due = crashed_at
+        #: Time the restarted backend connected, ``None`` while it is not connected.
+        self.connected_at = None
+
+
+class BackendSupervisor:
+    """Restarts backends that died unexpectedly, backing off exponentially while restarts fail.
+
+    The first restart is attempted ``RESTART_BACKOFF_MIN_MS`` after the crash, the delay doubles with every failed attempt up
+    to ``RESTART_BACKOFF_MAX_MS``. A restarted backend only counts as recovered once it stayed connected for
+    ``RESTART_STABLE_MS``, so one dying right after connecting is restarted with the next longer delay. Restart counts and
+    times to recovery are recorded per backend configuration.
+    """
+
+    def __init__(self, connection_manager, clock=time.monotonic):
+        self.connection_manager = connection_manager
+        self.clock = clock
+        #: Map from connection to its pending restart.
+        self._restarts = {}
+        #: Map from backend configuration to its crash and recovery statistics.
+        self.stats = {}
+
+    @staticmethod
+    def config_key(con):
+        """Human readable key of a connection's backend configuration."""
+        return '%s (%s)' % (con.service_config.command, con.service_config.config_file_path)
+
+    def config_stats(self, con):
+        return self.stats.setdefault(self.config_key(con), {'crashes': 0, 'restarts': 0, 'recoveries': 0, 'last_recovery_s': None,
+                                                            'max_recovery_s': 0.0, 'total_recovery_s': 0.0})
+
+    @property
+    def restarting(self):
+        """Is any restart pending?"""
+        return bool(self._restarts)
+
+    def is_restarting(self, con):
+        return con in self._restarts
+
+    def on_disconnected(self, con):
+        """Schedules (next) restart if the backend crashed or a restart attempt failed."""
+        restart = self._restarts.get(con)
+        if restart and restart.connected_at is not None:
+            restart.connected_at = None
+            if not con.crashed:
+                # disconnected on purpose before recovery was confirmed:
+                del self._restarts[con]
+                return
+        elif not restart:
+            if not con.crashed:
+                return
+            restart = self._restarts[con] = Restart(self.clock())
+            self.config_stats(con)['crashes'] += 1
+
+        delay = min(RESTART_BACKOFF_MIN_MS * 2 ** restart.attempts, RESTART_BACKOFF_MAX_MS)
+        restart.due = self.clock() + delay / 1000
+        _logger.info('Restarting backend %s in %.1f seconds.' % (con.service_config.command, delay / 1000))
+
+    def on_connected(self, con):
+        """Notes connection of a restarted backend, whose recovery is recorded by ``run`` once it stayed connected."""
+        restart = self._restarts.get(con)
+        if restart:
+            restart.connected_at = self.clock()
+
+    def _on_recovered(self, con, restart):
+        recovery = restart.connected_at - restart.crashed_at
+        stats = self.config_stats(con)
+        stats['recoveries'] += 1
+        stats['last_recovery_s'] = recovery
+        stats['max_recovery_s'] = max(stats['max_recovery_s'], recovery)
+        stats['total_recovery_s'] += recovery
+        _logger.info('Backend %s recovered after %.2f seconds and %d restart(s).' % (con.service_config.command, recovery, restart.attempts))
+
+    def run(self):
+        """Attempts due restarts and confirms recovery of restarted backends that stayed connected."""
+        if not self._restarts:
+            return
+
+        now = self.clock()
+        live_connections = self.connection_manager.registry.connections()
+        for con, restart in list(self._restarts.items()):
+            if con not in live_connections:
+                # connection was retired in the meantime:
+                del self._restarts[con]
+            elif restart.connected_at is not None:
+                if con.state is State.Connected and now - restart.connected_at >= RESTART_STABLE_MS / 1000:
+                    del self._restarts[con]
+                    self._on_recovered(con, restart)
+            elif restart.due <= now and con.state is State.Disconnected:
+                restart.attempts += 1
+                self.config_stats(con)['restarts'] += 1
+                con.connect()
+                if con.state is State.Disconnected:
+                    # backend could not even be launched:
+                    self.on_disconnected(con)
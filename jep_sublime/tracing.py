@@ -0,0 +1,92 @@
+"""Cheap tracing of hot path events into a ring buffer, formatted only when dumped."""
+import collections
+import logging
+import os
+import sys
+import time
+import sublime
+from .constants import TRACE_BUFFER_SIZE, TRACE_DUMP_MIN_INTERVAL_S
+
+#: Recent events as ``(time, message, args)``, the oldest are dropped first.
+_events = collections.deque(maxlen=TRACE_BUFFER_SIZE)
+
+
+def trace(message, *args):
+    """Records event. The message is formatted with the ``%`` operator and ``args`` only when the trace is dumped.
+
+    Arguments should be immutable values like file names, as they are kept until the event leaves the buffer.
+    """
+    _events.append((time.time(), message, args))
+
+
+def resize(size):
+    """Changes the number of events kept."""
+    global _events
+    if size != _events.maxlen:
+        _events = collections.deque(_events, maxlen=size)
+
+
+def format_events():
+    """Returns the recorded events, oldest first, one per line."""
+    lines = []
+    for timestamp, message, args in list(_events):
+        try:
+            text = message % args if args else message
+        except (TypeError, ValueError) as e:
+            text = '%s %r (%s)' % (message, args, e)
+        lines.append('%s.%03d %s' % (time.strftime('%H:%M:%S', time.localtime(timestamp)), int(timestamp * 1000) % 1000, text))
+    return '\n'.join(lines)
+
+
+def dump_to_file():
+    """Writes the recorded events to a new file in Sublime's cache directory and returns its path."""
+    directory = os.path.join(sublime.cache_path(), 'JEP', 'traces')
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime('trace-%Y%m%d-%H%M%S.log'))
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(format_events())
+        f.write('\n')
+    return path
+
+
+class TraceDumpHandler(logging.Handler):
+    """Logging handler dumping the trace to a file when an error is logged, at most every ``TRACE_DUMP_MIN_INTERVAL_S``."""
+
+    def __init__(self):
+        super().__init__(logging.ERROR)
+        self._dumped_at = None
+
+    def emit(self, record):
+        now = time.monotonic()
+        if self._dumped_at is not None and now - self._dumped_at < TRACE_DUMP_MIN_INTERVAL_S:
+            return
+        self._dumped_at = now
+        try:
+            trace('Error logged: %s', record.getMessage())
+            message = 'JEP: Trace of the last %d events written to %s.' % (len(_events), dump_to_file())
+            # not logged to avoid recursion in case writing fails:
+            sublime.status_message(message)
+            sys.stderr.write(message + '\n')
+        except Exception:
+            self.handleError(record)
+
+
+#: Handler installed on the loggers, ``None`` while not installed.
+_handler = None
+
+
+def install(logger_names):
+    """Dumps the trace whenever one of the named loggers logs an error."""
+    global _handler
+    if not _handler:
+        _handler = TraceDumpHandler()
+        for name in logger_names:
+            logging.getLogger(name).addHandler(_handler)
+
+
+def uninstall(logger_names):
+    global _handler
+    if _handler:
+        for name in logger_names:
+            logging.getLogger(name).removeHandler(_handler)
+        _handler = None
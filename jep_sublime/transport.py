@@ -0,0 +1,427 @@
+"""Transport of messages between Sublime and a JEP backend."""
+import collections
+import datetime
+import itertools
+import logging
+import threading
+import time
+import uuid
+from jep_py.config import TIMEOUT_LAST_MESSAGE
+from jep_py.frontend import BackendConnection, Frontend, State
+from jep_py.schema import ContentSync, Shutdown, TOKEN_ATTR_NAME
+from .constants import OUTBOUND_BACKLOG_DEPTH, OUTBOUND_DRAIN_PERIOD_MS
+from .content import content_delta
+from .metrics import ConnectionMetrics, MeteredSerializer
+from .tracing import trace
+
+_logger = logging.getLogger(__name__)
+
+
+class SublimeFrontend(Frontend):
+    """Frontend that can also connect to a service given by its configuration, without a file to be edited."""
+
+    def __init__(self, listeners=None, *, inbound_reader=None, supervisor=None, **kwargs):
+        super().__init__(listeners, **kwargs)
+        #: Reader decoding the messages of all connections on a worker thread, ``None`` to receive them within ``run``.
+        self.inbound_reader = inbound_reader
+        #: Supervisor restarting crashed backends, which are not reconnected here meanwhile.
+        self.supervisor = supervisor
+
+    def on_completion_response(self, completion_response, connection):
+        if not self.inbound_reader:
+            # without reader, responses to requests sent by ``send_request`` are only seen here:
+            connection.on_message_decoded(completion_response)
+
+    def get_connection(self, filename):
+        """Returns connection to a backend service that can deal with the given file. Existing service connections are reused if possible."""
+        trace('Service connector requested for file %s.', filename)
+        service_config = self.service_config_provider.provide_for(filename)
+        if not service_config:
+            trace('No service found for file %s.', filename)
+            return None
+        return self.get_service_connection(service_config)
+
+    def get_service_connection(self, service_config):
+        """Returns connection to the backend service of given configuration, starting the backend if needed."""
+        # check whether this service reference was used before:
+        connection = self.connection_by_service_selector[service_config.selector]
+        if connection:
+            if not connection.service_config.checksum == self.service_config_provider.checksum(service_config.config_file_path):
+                # configuration changed:
+                _logger.debug('Config file %s changed, need to renew connection.' % service_config.config_file_path)
+
+                # disconnect old and return new one (as disconnect can take a few cycles):
+                connection.reconnect(service_config)
+            elif connection.state is State.Disconnected and self.supervisor and self.supervisor.is_restarting(connection):
+                # backend crashed, the supervisor restarts it after backing off:
+                trace('Leaving restart of backend %s to the supervisor.', connection.service_config.command)
+            elif connection.state is State.Disconnected:
+                # reattempt to connect:
+                _logger.debug('Reconnecting existing connection.')
+                connection.connect()
+        else:
+            _logger.debug('Creating new connection.')
+            connection = self._connect(service_config)
+
+        return connection
+
+    def release_connection(self, connection):
+        """Forgets given connection, so the next request for its service creates a new one."""
+        if self.connection_by_service_selector.get(connection.service_config.selector) is connection:
+            del self.connection_by_service_selector[connection.service_config.selector]
+
+
+class SublimeBackendConnection(BackendConnection):
+    """Backend connection with an outbound message queue, sending file content as deltas.
+
+    Messages are queued and serialized into one buffer by ``flush_outbound``, which the connection manager calls once per
+    tick, and the buffer is written until the socket does not accept more without blocking. A content sync replaces a
+    queued but unsent sync of the same file, so a backend that is slow to read only receives the newest content. Requests
+    and shutdown messages flush the queue right away, so a request is written together with the content it refers to, and
+    the rest of the buffer is written while waiting for a response.
+
+    The connection keeps a shadow copy of the content last sent for each file. Content syncs carrying a whole file are
+    reduced to the changed range when they are written, unless the backend does not know the file yet. The shadow survives
+    a backend restart and is replayed to the new backend by ``replay_content``.
+
+    If the backend dies unexpectedly, the connection does not reconnect by itself but sets ``crashed``, leaving the
+    restart to a supervisor.
+
+    If the frontend has an inbound reader, messages are received and decoded on its thread while connected. ``run`` then
+    never waits but advances the state machine once, and ``request_message`` waits for the reader to hand over the
+    response.
+    """
+
+    def __init__(self, frontend, service_config, listeners, **kwargs):
+        #: Latency and traffic metrics.
+        self.metrics = ConnectionMetrics()
+        kwargs.setdefault('serializer', MeteredSerializer(self.metrics))
+        super().__init__(frontend, service_config, listeners, **kwargs)
+        #: Map from file name to content last sent.
+        self._content_shadow = {}
+        #: Map from file name to version (Sublime change count) of the content last sent.
+        self.content_versions = {}
+        #: Names of closed files whose shadow content is still kept, least recently closed first.
+        self._released = collections.OrderedDict()
+        #: Names of files whose content was sent to the currently connected backend.
+        self._synced_files = set()
+        #: Did the backend die unexpectedly when the connection was lost the last time?
+        self.crashed = False
+        #: Queued messages by key, content syncs are keyed by file to replace each other.
+        self._outbound = collections.OrderedDict()
+        #: Serialized data not yet accepted by the socket.
+        self._outbound_data = bytearray()
+        #: Key generator for messages that are never replaced.
+        self._keys = itertools.count()
+        #: Counters of the outbound queue.
+        self.outbound_stats = {'queued': 0, 'coalesced': 0, 'written': 0, 'writes': 0, 'bytes': 0, 'max_depth': 0}
+        #: Monotonic time of last use, to find idle and least recently used backends.
+        self.last_used = time.monotonic()
+        #: Set by the inbound reader when a response to the pending request or the end of the connection was received.
+        self._response_received = threading.Event()
+        #: Did the inbound reader find the socket closed by the backend?
+        self.inbound_closed = False
+        #: Map from token of a request sent by ``send_request`` to its response, ``None`` until received.
+        self._awaited = {}
+        self._awaited_lock = threading.Lock()
+
+    @property
+    def inbound_reader(self):
+        return self.frontend.inbound_reader
+
+    @property
+    def queue_depth(self):
+        """Number of messages waiting to be written."""
+        return len(self._outbound)
+
+    @property
+    def draining(self):
+        """Is serialized data waiting for the socket to accept it?"""
+        return bool(self._outbound_data)
+
+    @property
+    def backlogged(self):
+        """Does the backend read slower than messages are produced? Used as back-pressure signal by the sync scheduling."""
+        return bool(self._outbound_data) or len(self._outbound) >= OUTBOUND_BACKLOG_DEPTH
+
+    def send_message(self, message):
+        self.last_used = time.monotonic()
+        stats = self.outbound_stats
+        if isinstance(message, ContentSync):
+            key = ('sync', message.file)
+            if key in self._outbound:
+                stats['coalesced'] += 1
+        else:
+            key = next(self._keys)
+        self._outbound[key] = message
+        stats['queued'] += 1
+        stats['max_depth'] = max(stats['max_depth'], len(self._outbound))
+
+        if isinstance(message, Shutdown) or getattr(message, TOKEN_ATTR_NAME, None) is not None:
+            self.flush_outbound()
+
+    def request_message(self, message, duration):
+        """Sends request message, preceded by all queued messages in the same write, and waits for the response.
+
+        If the request message has a ``file`` attribute, it is tagged with the ``content_version`` it refers to.
+        """
+        filename = getattr(message, 'file', None)
+        if filename is not None:
+            message.content_version = self.content_versions.get(filename)
+
+        started = time.perf_counter()
+        if self.inbound_reader:
+            response = self._request_from_reader(message, duration)
+        else:
+            response = super().request_message(message, duration)
+        if response is not None:
+            self.metrics.on_response(type(message).__name__, time.perf_counter() - started)
+            trace('%s for %s answered in %.1f ms.', type(message).__name__, filename, 1000 * (time.perf_counter() - started))
+        elif self.state is State.Connected:
+            self.metrics.on_timeout(type(message).__name__)
+            trace('%s for %s timed out.', type(message).__name__, filename)
+        return response
+
+    def send_request(self, message):
+        """Sends request message without waiting for the response, returns its token or ``None`` if not connected.
+
+        The response is dispatched to the listeners as usual, and kept until taken by ``take_response`` or forgotten.
+        """
+        if self.state is not State.Connected:
+            return None
+
+        filename = getattr(message, 'file', None)
+        if filename is not None:
+            message.content_version = self.content_versions.get(filename)
+        token = getattr(message, TOKEN_ATTR_NAME)
+        if token is None:
+            token = uuid.uuid1().hex
+            setattr(message, TOKEN_ATTR_NAME, token)
+        with self._awaited_lock:
+            self._awaited[token] = None
+        self.send_message(message)
+        return token
+
+    def has_response(self, token):
+        """Was the response to the request with given token received?"""
+        return self._awaited.get(token) is not None
+
+    def take_response(self, token, duration):
+        """Returns response to request sent by ``send_request``, waiting up to given duration, and forgets the request."""
+        deadline = time.monotonic() + duration.total_seconds()
+        while not self.has_response(token) and self.state is State.Connected:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            if self.inbound_reader:
+                self._response_received.clear()
+                # checked again after clearing, the response may have been received in the meantime:
+                if not self.has_response(token):
+                    self._wait_for_response(remaining)
+            else:
+                super().run(datetime.timedelta(seconds=min(remaining, 0.005)))
+        return self.forget_request(token)
+
+    def forget_request(self, token):
+        """Drops request sent by ``send_request`` and returns its response if it was received."""
+        with self._awaited_lock:
+            return self._awaited.pop(token, None)
+
+    def _request_from_reader(self, message, duration):
+        """Sends request message and blocks until the inbound reader received its response or given duration passed."""
+        if self.state is not State.Connected:
+            _logger.warning('Skipping request message, since connector is not connected.')
+            return None
+
+        token = getattr(message, TOKEN_ATTR_NAME)
+        if token is None:
+            token = uuid.uuid1().hex
+            setattr(message, TOKEN_ATTR_NAME, token)
+
+        self._response_received.clear()
+        self._current_request_response = None
+        self._current_request_token = token
+        self.send_message(message)
+        self._wait_for_response(duration.total_seconds())
+        self._current_request_token = None
+        response, self._current_request_response = self._current_request_response, None
+        return response
+
+    def _wait_for_response(self, seconds):
+        """Waits for the inbound reader to signal a response, meanwhile writing data the socket did not accept yet."""
+        deadline = time.monotonic() + seconds
+        while True:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return False
+            if not self._outbound_data:
+                return self._response_received.wait(remaining)
+            if self._response_received.wait(min(remaining, OUTBOUND_DRAIN_PERIOD_MS / 1000)):
+                return True
+            self.flush_outbound()
+
+    def on_message_decoded(self, message):
+        """Called by the inbound reader on its thread for each message, before it is dispatched on the main thread."""
+        token = getattr(message, TOKEN_ATTR_NAME, None)
+        if token is None:
+            return
+        if token == self._current_request_token:
+            self._current_request_response = message
+            self._response_received.set()
+        elif token in self._awaited:
+            with self._awaited_lock:
+                if token in self._awaited:
+                    self._awaited[token] = message
+            self._response_received.set()
+
+    def on_inbound_closed(self, sock):
+        """Called by the inbound reader on its thread when the backend closed given socket."""
+        if sock is not self._socket:
+            # socket was replaced by a new connection in the meantime:
+            return
+        self.inbound_closed = True
+        # no response will come anymore:
+        self._response_received.set()
+
+    def dispatch_message(self, message):
+        """Runs the handlers of the frontend and of the listeners for given message, on the main thread."""
+        message.invoke(self.frontend, self)
+        for listener in self.listeners:
+            message.invoke(listener, self)
+
+    def run(self, duration):
+        if not self.inbound_reader:
+            super().run(duration)
+        else:
+            # messages are received on the reader's thread, so there is nothing to wait for:
+            self._dispatch(duration)
+
+    def forget_content(self, filename):
+        """Drops shadow content of file, so the next sync sends it completely."""
+        self._content_shadow.pop(filename, None)
+        self.content_versions.pop(filename, None)
+        self._synced_files.discard(filename)
+        self._released.pop(filename, None)
+
+    def release_content(self, filename, keep):
+        """Marks file as closed, keeping the shadow content of the ``keep`` most recently closed files for a reopen."""
+        if filename in self._content_shadow:
+            self._released[filename] = True
+            self._released.move_to_end(filename)
+            while len(self._released) > keep:
+                self.forget_content(next(iter(self._released)))
+
+    def replay_content(self, filenames):
+        """Sends content of given files, in given order and in a single batch, to a backend that does not know them yet.
+
+        Content still queued for a file is sent instead of its shadow, as it is newer.
+        """
+        queued = self._outbound
+        self._outbound = collections.OrderedDict()
+        for filename in filenames:
+            key = ('sync', filename)
+            message = queued.pop(key, None)
+            if message is None and filename in self._content_shadow and filename not in self._synced_files:
+                message = ContentSync(filename, self._content_shadow[filename])
+                message.content_version = self.content_versions.get(filename)
+            if message:
+                self._outbound[key] = message
+        self._outbound.update(queued)
+        self.flush_outbound()
+
+    def flush_outbound(self):
+        """Writes queued messages to the backend, as far as the socket accepts them without blocking."""
+        if self.state is not State.Connected:
+            if self._outbound:
+                trace('In state %s no messages are sent to backend, %d message(s) queued.', self.state.name, len(self._outbound))
+            return
+
+        try:
+            # new messages go behind data not written yet, so a request is never held back by a partially written sync:
+            if self._outbound:
+                self.metrics.on_queue_depth(len(self._outbound))
+                messages = [self._reduce(message) for message in self._outbound.values()]
+                self._outbound.clear()
+                for message in filter(None, messages):
+                    data = self._serializer.serialize(message)
+                    self._outbound_data.extend(data)
+                    self.outbound_stats['written'] += 1
+                    self.metrics.on_sent(type(message).__name__, len(data))
+
+            while self._outbound_data:
+                sent = self._socket.send(self._outbound_data)
+                del self._outbound_data[:sent]
+                self.outbound_stats['writes'] += 1
+                self.outbound_stats['bytes'] += sent
+        except BlockingIOError:
+            # backend does not read fast enough, the rest is written by the next flush:
+            pass
+        except Exception as e:
+            _logger.warning('Sending message failed: %s' % e)
+
+    def _reduce(self, message):
+        """Reduces a content sync of a whole file to the range changed since the last sync, ``None`` if nothing changed."""
+        if not isinstance(message, ContentSync) or message.start != 0 or message.end is not None:
+            return message
+
+        filename = message.file
+        self._released.pop(filename, None)
+        previous = self._content_shadow.get(filename)
+        self._content_shadow[filename] = message.data
+        self.content_versions[filename] = getattr(message, 'content_version', None)
+        if previous is None or filename not in self._synced_files:
+            self._synced_files.add(filename)
+            return message
+
+        delta = content_delta(previous, message.data)
+        if not delta:
+            return None
+
+        start, end, data = delta
+        return ContentSync(filename, data, start, end)
+
+    def _run_connected(self, duration):
+        if self._outbound_data:
+            self.flush_outbound()
+        if not self.inbound_reader:
+            super()._run_connected(duration)
+            return
+
+        self._read_backend_output()
+        if self.inbound_closed:
+            _logger.warning('Backend closed connection unexpectedly.')
+            self._cleanup()
+        elif datetime.datetime.now() - self._state_timer_reset > TIMEOUT_LAST_MESSAGE:
+            _logger.debug('Backend did not sent any message for %.2f seconds, reconnecting.' % TIMEOUT_LAST_MESSAGE.total_seconds())
+            self.reconnect()
+
+    def _connect(self, port, duration):
+        # a new connection may be served by a new backend process, not knowing any content:
+        self._synced_files.clear()
+        self.inbound_closed = False
+        super()._connect(port, duration)
+        if self.inbound_reader and self.state is State.Connected:
+            self.inbound_reader.watch(self)
+
+    def _cleanup(self, duration=None):
+        self.crashed = self._reconnect_expected and self.state is not State.Disconnecting
+        if self.crashed:
+            _logger.warning('Backend %s died unexpectedly.' % self.service_config.command)
+            # restart is left to supervisor, which backs off if the backend keeps dying:
+            self._reconnect_expected = False
+
+        if self.inbound_reader:
+            self.inbound_reader.unwatch(self)
+            self._response_received.set()
+        with self._awaited_lock:
+            self._awaited.clear()
+
+        # keep content to be replayed to the next backend, drop everything else:
+        for key in [key for key, message in self._outbound.items() if not isinstance(message, ContentSync)]:
+            del self._outbound[key]
+        del self._outbound_data[:]
+
+        if duration is None:
+            super()._cleanup()
+        else:
+            super()._cleanup(duration)
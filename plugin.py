@@ -1,15 +1,26 @@
 import logging
+import os
 import sys
-from os.path import dirname, join
+import time
+from os.path import basename, dirname, join
+
+#: Start of plugin module import, reported once the plugin was loaded.
+_import_started = time.perf_counter()
 
 sys.path.append(join(dirname(__file__), "contrib"))
 sys.path.append(join(dirname(__file__), "..", "jep-python"))
 
-from .jep_sublime.connection import ConnectionManager
+import sublime
 import sublime_plugin
+from .jep_sublime import tracing
+from .jep_sublime.constants import RECORDING_FILE_EXTENSION, SERVICE_CONFIG_FILE_NAME
+from .jep_sublime.tracing import trace
 
 _logger = logging.getLogger(__name__)
 
+#: Loggers whose errors trigger a dump of the trace.
+TRACED_LOGGERS = (__package__, 'jep_py')
+
 
 def plugin_loaded():
     JepSublimeEventListener.instance.on_plugin_loaded()
@@ -19,8 +30,20 @@ def plugin_unloaded():
     JepSublimeEventListener.instance.on_plugin_unloaded()
 
 
+def show_report(name, text):
+    """Shows text in a new scratch view of the active window."""
+    view = sublime.active_window().new_file()
+    view.set_name(name)
+    view.set_scratch(True)
+    view.run_command('append', {'characters': text})
+
+
 class JepSublimeEventListener(sublime_plugin.EventListener):
-    """Entry point for Sublime events, composes object tree."""
+    """Entry point for Sublime events, composes object tree.
+
+    The JEP subsystems (connection management, content tracking, syntax management) are only built once the first view is
+    found that is handled by a JEP backend, so plugin startup does not pay for them in sessions not using JEP.
+    """
 
     backend_adapter = None
     instance = None
@@ -28,41 +51,285 @@ class JepSublimeEventListener(sublime_plugin.EventListener):
     def __init__(self):
         assert not JepSublimeEventListener.instance
         JepSublimeEventListener.instance = self
+        self.service_config_provider = None
+        #: Counters of the on_modified hot path: calls, calls skipped for untracked views, seconds spent on tracked views.
+        self.on_modified_stats = {'calls': 0, 'skipped': 0, 'seconds': 0.0}
+        #: Recorder of the current session, ``None`` unless a session is being recorded.
+        self.recorder = None
+        #: Profiler measuring callbacks and hot paths, ``None`` until profiling is enabled the first time.
+        self.profiler = None
 
     def on_plugin_loaded(self, backend_adapter=None):
+        started = time.perf_counter()
         _logger.debug('Initializing JEP Plugin after Sublime loaded plugin.')
-        self.backend_adapter = backend_adapter or ConnectionManager()
-        self.backend_adapter.run_periodically()
+        if backend_adapter:
+            self.backend_adapter = backend_adapter
+            self.backend_adapter.listener_stats = self.on_modified_stats
+            self.backend_adapter.run_periodically()
+        from .jep_sublime import settings
+        tracing.resize(settings.get('trace_buffer_size'))
+        tracing.install(TRACED_LOGGERS)
+        if settings.get('profiling'):
+            self.enable_profiling()
+        sublime.set_timeout(self.prewarm, 0)
+        _logger.info('JEP plugin loaded in %.1f ms (module import took %.1f ms).' % ((time.perf_counter() - started) * 1000, _import_duration * 1000))
 
     def on_plugin_unloaded(self):
         if JepSublimeEventListener.instance:
             _logger.debug('Unloading plugin.')
+            tracing.uninstall(TRACED_LOGGERS)
+            if self.recorder:
+                self.stop_recording()
+            if self.backend_adapter:
+                self.backend_adapter.completion_snapshots.save(blocking=True)
+                self.backend_adapter.shutdown()
             JepSublimeEventListener.instance = None
 
+    def get_or_create_backend_adapter(self, view):
+        """Returns the backend adapter, creating it if the given view is the first one handled by a JEP backend."""
+        if not self.backend_adapter:
+            filename = view.file_name()
+            if not filename:
+                return None
+
+            if not self.get_service_config_provider().provide_for(filename):
+                return None
+
+            self.create_backend_adapter(filename)
+
+        return self.backend_adapter
+
+    def create_backend_adapter(self, reason):
+        started = time.perf_counter()
+        from .jep_sublime.connection import ConnectionManager
+        self.backend_adapter = ConnectionManager(service_config_provider=self.get_service_config_provider())
+        self.backend_adapter.listener_stats = self.on_modified_stats
+        if self.recorder:
+            self.backend_adapter.add_listener(self.recorder)
+        if self.profiler:
+            self.profiler.instrument_backend_adapter(self.backend_adapter)
+        self.backend_adapter.run_periodically()
+        _logger.info('JEP subsystems created in %.1f ms for %s.' % ((time.perf_counter() - started) * 1000, reason))
+
+    def prewarm(self, windows=None):
+        """Starts backends configured for the files and folders open in given windows (default: all) in the background."""
+        from .jep_sublime import settings
+        if not settings.get('prewarm'):
+            return
+
+        windows = sublime.windows() if windows is None else windows
+        if not self.backend_adapter:
+            if not self.get_service_config_provider().provide_for_windows(windows):
+                return
+            self.create_backend_adapter('pre-warming')
+
+        self.backend_adapter.prewarmer.scan(windows)
+
+    def get_service_config_provider(self):
+        """Returns the cached resolution of files to ``.jep`` service configurations."""
+        if not self.service_config_provider:
+            from .jep_sublime.resolution import CachingServiceConfigProvider
+            self.service_config_provider = CachingServiceConfigProvider()
+        return self.service_config_provider
+
+    def start_recording(self):
+        """Starts recording callbacks and backend messages of views handled by JEP."""
+        from .jep_sublime.recording import SessionRecorder
+        directory = join(sublime.cache_path(), 'JEP', 'recordings')
+        os.makedirs(directory, exist_ok=True)
+        self.recorder = SessionRecorder(join(directory, time.strftime('session-%Y%m%d-%H%M%S') + RECORDING_FILE_EXTENSION))
+        if self.backend_adapter:
+            self.backend_adapter.add_listener(self.recorder)
+        sublime.status_message('JEP: Recording session to %s.' % self.recorder.path)
+
+    def stop_recording(self):
+        """Stops recording and writes the recorded session."""
+        recorder, self.recorder = self.recorder, None
+        if self.backend_adapter:
+            self.backend_adapter.remove_listener(recorder)
+        recorder.save()
+        sublime.status_message('JEP: Session recorded to %s.' % recorder.path)
+
+    def enable_profiling(self):
+        if not self.profiler:
+            from .jep_sublime.profiling import Profiler
+            self.profiler = Profiler()
+        self.profiler.enable(self)
+
+    def disable_profiling(self):
+        if self.profiler:
+            self.profiler.disable()
+
+    def _record(self, kind, view, *args):
+        """Records callback for view if it is handled by JEP."""
+        backend_adapter = self.backend_adapter
+        if backend_adapter and view.id() in backend_adapter.registry.views:
+            con = backend_adapter.get_connection_for_view(view)
+            self.recorder.on_view_event(kind, view, *args, config_file_path=con.service_config.config_file_path if con else None)
+
+    def on_load_project(self, window):
+        """Project was opened in window."""
+        self.prewarm([window])
+
     def on_activated(self, view):
         """Activation of existing view, needed to capture files in editor from last Sublime session."""
-        _logger.debug('Activated view %s.' % view.file_name())
+        trace('Activated view %s.', view.file_name())
         if view.file_name():
-            self.backend_adapter.connect(view)
+            backend_adapter = self.get_or_create_backend_adapter(view)
+            if backend_adapter:
+                backend_adapter.connect(view)
+                if self.recorder:
+                    self._record('activated', view)
 
     def on_load(self, view):
         """File was opened from disk."""
-        _logger.debug('Loaded view %s.' % view.file_name())
-        self.backend_adapter.connect(view)
+        trace('Loaded view %s.', view.file_name())
+        backend_adapter = self.get_or_create_backend_adapter(view)
+        if backend_adapter:
+            backend_adapter.connect(view)
+            if self.recorder:
+                self._record('load', view)
 
     def on_post_save(self, view):
         """File was saved to disk. For a new file we now have a name."""
-        _logger.debug('Saved view %s.' % view.file_name())
-        self.backend_adapter.connect(view)
+        trace('Saved view %s.', view.file_name())
+        filename = view.file_name()
+        if filename and basename(filename) == SERVICE_CONFIG_FILE_NAME:
+            self.get_service_config_provider().invalidate(filename)
+        backend_adapter = self.get_or_create_backend_adapter(view)
+        if backend_adapter:
+            backend_adapter.connect(view)
+            if self.recorder:
+                self._record('save', view)
 
     def on_close(self, view):
         """File was removed from editor."""
-        _logger.debug('Closed view %s.' % view.file_name())
-        self.backend_adapter.disconnect(view)
+        trace('Closed view %s.', view.file_name())
+        if self.backend_adapter:
+            if self.recorder:
+                self._record('close', view)
+            self.backend_adapter.disconnect(view)
 
     def on_query_completions(self, view, prefix, locations):
-        return self.backend_adapter.auto_completer.on_query_completions(view, prefix, locations)
+        if self.backend_adapter:
+            started = time.perf_counter()
+            result = self.backend_adapter.auto_completer.on_query_completions(view, prefix, locations)
+            if self.recorder:
+                self._record('completions', view, prefix, locations[0], int((time.perf_counter() - started) * 1000))
+            return result
+
+    def on_selection_modified(self, view):
+        """Caret was moved, called for every keystroke and cursor movement in every view."""
+        backend_adapter = self.backend_adapter
+        if backend_adapter and view.id() in backend_adapter.registry.views:
+            backend_adapter.error_annotator.on_selection_modified(view)
+            if self.recorder:
+                self._record('selection', view, view.sel()[0].b)
 
     def on_modified(self, view):
-        """View content was modified by user."""
-        self.backend_adapter.mark_content_modified(view)
+        """View content was modified by user, called for every keystroke in every view."""
+        stats = self.on_modified_stats
+        stats['calls'] += 1
+        backend_adapter = self.backend_adapter
+        if not backend_adapter or view.id() not in backend_adapter.registry.views:
+            stats['skipped'] += 1
+            return
+
+        started = time.perf_counter()
+        backend_adapter.mark_content_modified(view)
+        stats['seconds'] += time.perf_counter() - started
+        if self.recorder:
+            self._record('modified', view)
+
+
+class JepStartSessionRecordingCommand(sublime_plugin.ApplicationCommand):
+    """Starts recording the editing session for replay by the benchmark harness."""
+
+    def run(self):
+        JepSublimeEventListener.instance.start_recording()
+
+    def is_enabled(self):
+        return bool(JepSublimeEventListener.instance) and not JepSublimeEventListener.instance.recorder
+
+
+class JepStopSessionRecordingCommand(sublime_plugin.ApplicationCommand):
+    """Stops recording the editing session and writes it to Sublime's cache directory."""
+
+    def run(self):
+        JepSublimeEventListener.instance.stop_recording()
+
+    def is_enabled(self):
+        return bool(JepSublimeEventListener.instance and JepSublimeEventListener.instance.recorder)
+
+
+class JepToggleProfilingCommand(sublime_plugin.ApplicationCommand):
+    """Enables or disables measuring the time spent in the plugin's callbacks and hot paths."""
+
+    def run(self):
+        listener = JepSublimeEventListener.instance
+        if listener.profiler and listener.profiler.enabled:
+            listener.disable_profiling()
+            sublime.status_message('JEP: Profiling disabled.')
+        else:
+            listener.enable_profiling()
+            sublime.status_message('JEP: Profiling enabled.')
+
+    def is_enabled(self):
+        return bool(JepSublimeEventListener.instance)
+
+
+class JepShowProfilingReportCommand(sublime_plugin.ApplicationCommand):
+    """Shows the durations measured by the profiler."""
+
+    def run(self):
+        show_report('JEP Profiling Report', JepSublimeEventListener.instance.profiler.report())
+
+    def is_enabled(self):
+        return bool(JepSublimeEventListener.instance and JepSublimeEventListener.instance.profiler)
+
+
+class JepShowBackendMetricsCommand(sublime_plugin.ApplicationCommand):
+    """Shows request latency, timeouts, traffic and queue depths of each backend connection, and the plugin's counters."""
+
+    def run(self):
+        show_report('JEP Backend Metrics', JepSublimeEventListener.instance.backend_adapter.metrics_report())
+
+    def is_enabled(self):
+        return bool(JepSublimeEventListener.instance and JepSublimeEventListener.instance.backend_adapter)
+
+
+class JepShowTraceCommand(sublime_plugin.ApplicationCommand):
+    """Shows the most recent events traced by the plugin."""
+
+    def run(self):
+        show_report('JEP Trace', tracing.format_events())
+
+
+class JepShowMemoryReportCommand(sublime_plugin.ApplicationCommand):
+    """Shows number of entries and approximate size of the plugin's stores."""
+
+    def run(self):
+        from .jep_sublime.memory import format_store_sizes, store_sizes
+        show_report('JEP Memory Report', format_store_sizes(store_sizes(JepSublimeEventListener.instance)))
+
+    def is_enabled(self):
+        return bool(JepSublimeEventListener.instance)
+
+
+class JepTakeMemorySnapshotCommand(sublime_plugin.ApplicationCommand):
+    """Shows the allocations grown since the previous snapshot, starts tracing allocations on first use."""
+
+    diff = None
+
+    def run(self):
+        from .jep_sublime.memory import TracemallocDiff
+        if not TracemallocDiff.is_available():
+            sublime.status_message('JEP: tracemalloc is not available in this Python version.')
+            return
+        if not JepTakeMemorySnapshotCommand.diff:
+            JepTakeMemorySnapshotCommand.diff = TracemallocDiff()
+        show_report('JEP Memory Snapshot', JepTakeMemorySnapshotCommand.diff.snapshot())
+
+
+#: Duration of plugin module import in seconds, assigned last to include all definitions.
+_import_duration = time.perf_counter() - _import_started